@@ -0,0 +1,259 @@
+# Headless benchmark runner for the nonogram solvers (does not import PyQt)
+# Author: Fabian Kraus
+# run with: python3 -m gui.benchmark [options]
+#    e.g. : python3 -m gui.benchmark --timeout 30 --csv bench.csv --json bench.json
+#           python3 -m gui.benchmark --solvers sbs-improved symbolic-block-start --puzzles nonograms/survey_by_numbers_dataset
+#           python3 -m gui.benchmark --solvers sbs-improved --threads 1 2 4 8 --puzzles nonograms/survey_by_numbers_dataset
+#           python3 -m gui.benchmark --decode 100
+#           python3 -m gui.benchmark --io 2000
+
+import argparse
+import csv
+import json
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, asdict
+from os import listdir
+from os.path import isfile, join
+from typing import List
+
+import numpy as np
+from clingo import Control, Model
+
+from .common import FillDecoder, Nonogram, NonogramSoln, format_time
+from .corpus import Corpus, is_corpus
+from .handlers.batch_handler import BatchHandler
+from .handlers.nonogram_handler import NonogramHandler
+from .handlers.solution_handler import SolutionHandler, SolverResult, list_solvers
+
+DEFAULT_PUZZLE_DIRS = ["nonograms", "nonograms/survey_by_numbers_dataset"]
+
+
+@dataclass
+class BenchmarkResult:
+    solver: str
+    puzzle: str
+    width: int
+    height: int
+    ground_time: float
+    solve_time: float
+    models: int
+    timed_out: bool
+    threads: int = 1
+    error: str = ""
+    ground_atoms: int = 0
+    ground_rules: int = 0
+    choices: int = 0
+    conflicts: int = 0
+    restarts: int = 0
+    winner: str = "" # solver that produced the result (for the portfolio: the one that won the race)
+    propagation_time: float = 0.0
+
+
+def find_puzzles(dirs: List[str]) -> List[str]:
+    """Paths of all nonogram files (.lp and .txt) directly inside the given directories"""
+    puzzles = []
+    for d in dirs:
+        puzzles += sorted(join(d, f) for f in listdir(d) if isfile(join(d, f)) and f.split(".")[-1] in ("lp", "txt"))
+    return puzzles
+
+
+def print_result(result: BenchmarkResult) -> None:
+    print(f"{result.solver:>24} {result.puzzle:<56} threads {result.threads:>3}  ground {format_time(result.ground_time):>10}  "
+          f"solve {format_time(result.solve_time):>10}  models {result.models}  "
+          f"atoms {result.ground_atoms} rules {result.ground_rules} choices {result.choices} conflicts {result.conflicts}"
+          f"{f" won by {result.winner}" if result.solver == "portfolio" else ""}{" (timeout)" if result.timed_out else ""}")
+
+
+def run_benchmark(solvers: List[str], puzzles: List[str], timeout: float,
+                  check_unique: bool = True, all_models: bool = False, jobs: int = 1,
+                  thread_counts: List[int] | None = None, parallel_mode: str = "compete",
+                  use_propagation: bool = True) -> List[BenchmarkResult]:
+    """Run every solver with every clingo thread count on every puzzle and collect the timings, optionally on several worker processes"""
+    results = []
+    loaded = []
+    for puzzle in puzzles:
+        # Corpus archives contribute all of their puzzles, named archive:id
+        if is_corpus(puzzle):
+            corpus = Corpus(puzzle)
+            loaded += [(f"{puzzle}:{puzzle_id}", corpus[i]) for i, puzzle_id in enumerate(corpus.ids)]
+            continue
+        nonogram_handler = NonogramHandler()
+        try:
+            nonogram_handler.load_file(puzzle)
+        except Warning as w:
+            print(f"Skipping {puzzle}: {w.args[0]}", file=sys.stderr)
+            for solver in solvers:
+                results.append(BenchmarkResult(solver, puzzle, 0, 0, 0.0, 0.0, 0, False, error=w.args[0]))
+            continue
+        loaded.append((puzzle, nonogram_handler.get_curr_nonogram()))
+
+    for solver in solvers:
+        for threads in thread_counts or [1]:
+            # The portfolio already runs one process per solver, so it is never nested inside the pool
+            if jobs > 1 and solver != "portfolio":
+                batch_handler = BatchHandler()
+                batch_handler.set_processes(jobs)
+                batch_handler.set_timeout(timeout)
+                batch_handler.set_threads(threads, parallel_mode)
+                batch_handler.use_propagation = use_propagation
+                batch = batch_handler.run_batch([nonogram for _, nonogram in loaded], solver, check_unique, all_models)
+                runs = ((loaded[r.index], r.result) for r in batch)
+            else:
+                runs = (((puzzle, nonogram), _run_single(nonogram, solver, timeout, check_unique, all_models,
+                                                         threads, parallel_mode, use_propagation))
+                        for puzzle, nonogram in loaded)
+
+            for (puzzle, nonogram), run in runs:
+                result = BenchmarkResult(solver, puzzle, nonogram.width, nonogram.height,
+                                         run.ground_time, run.solve_time, run.models, run.timed_out, threads, "",
+                                         run.ground_atoms, run.ground_rules, run.choices, run.conflicts, run.restarts,
+                                         run.solver.removeprefix("portfolio/"), run.propagation_time)
+                results.append(result)
+                print_result(result)
+    return results
+
+
+def _run_single(nonogram, solver: str, timeout: float, check_unique: bool, all_models: bool,
+                threads: int, parallel_mode: str, use_propagation: bool) -> SolverResult:
+    soln_handler = SolutionHandler()
+    soln_handler.use_propagation = use_propagation
+    soln_handler.give_nonogram(nonogram)
+    soln_handler.set_timeout(timeout)
+    soln_handler.set_threads(threads, parallel_mode)
+    if solver == "portfolio":
+        return soln_handler.run_solver_portfolio(check_unique, all_models)
+    return soln_handler.run_solver(solver, check_unique, all_models)
+
+
+def _fill_from_atoms(grid: np.ndarray, model: Model) -> None:
+    # Previous decoding: scan all atoms and set one cell per fill atom
+    grid.fill(0)
+    for symbol in model.symbols(atoms=True):
+        if symbol.name == 'fill':
+            grid[symbol.arguments[0].number - 1, symbol.arguments[1].number - 1] = 1
+
+
+def run_decode_benchmark(size: int, repeats: int = 20) -> None:
+    """Microbenchmark of the model decoding paths on a single size x size model with about 60% black cells
+    (and some hidden auxiliary atoms, like the block starts of the encodings)"""
+    ctl = Control(["1"])
+    ctl.add("base", [], f"row(1..{size}). col(1..{size}). fill(R,C) :- row(R), col(C), (R*7+C*3)\\5 < 3. "
+                       f"start(R,C) :- fill(R,C), not fill(R,C-1). #show fill/2.")
+    ctl.ground([("base", [])])
+    nonogram = Nonogram()
+    nonogram.width = nonogram.height = size
+
+    setup_start = time.perf_counter()
+    decoder = FillDecoder(ctl.symbolic_atoms, size)
+    setup_time = time.perf_counter() - setup_start
+
+    def on_model(model: Model) -> None:
+        reference = NonogramSoln(nonogram)
+        _fill_from_atoms(reference.grid, model)
+        soln = NonogramSoln(nonogram)
+        for name, decode in (("all atoms (previous)", lambda: _fill_from_atoms(soln.grid, model)),
+                             ("shown symbols", lambda: soln.fill_from_model(model)),
+                             ("fill atom lookup", lambda: soln.fill_from_model(model, decoder))):
+            start = time.perf_counter()
+            for _ in range(repeats):
+                decode()
+            assert np.array_equal(soln.grid, reference.grid)
+            print(f"{name:>24}: {format_time((time.perf_counter() - start) / repeats):>10} per model")
+
+    print(f"Decoding a {size}x{size} model ({repeats} repeats), lookup setup {format_time(setup_time)}")
+    ctl.solve(on_model=on_model)
+
+
+def run_io_benchmark(size: int, density: float = 0.5, seed: int = 0) -> None:
+    """Time saving and loading a random size x size nonogram in both file formats"""
+    grid = np.random.default_rng(seed).random((size, size)) < density
+    nonogram = Nonogram()
+    start = time.perf_counter()
+    nonogram.init_from_grid(grid)
+    hints = sum(map(len, nonogram.row_hints)) + sum(map(len, nonogram.col_hints))
+    print(f"{size}x{size} nonogram with {hints:,} hints, computed from the grid in {format_time(time.perf_counter() - start)}")
+
+    handler = NonogramHandler()
+    handler.loaded_nonogram = nonogram
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for filetype in ("lp", "txt"):
+            path = join(tmp_dir, f"instance.{filetype}")
+            start = time.perf_counter()
+            handler.save_file(path)
+            save_time = time.perf_counter() - start
+
+            loader = NonogramHandler()
+            start = time.perf_counter()
+            loader.load_file(path)
+            load_time = time.perf_counter() - start
+            loaded = loader.get_curr_nonogram()
+            assert loaded.row_hints == nonogram.row_hints and loaded.col_hints == nonogram.col_hints
+            print(f"{'.' + filetype:>5}: save {format_time(save_time):>10}, load {format_time(load_time):>10}")
+
+
+def write_csv(results: List[BenchmarkResult], path: str) -> None:
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(BenchmarkResult.__dataclass_fields__))
+        writer.writeheader()
+        for result in results:
+            writer.writerow(asdict(result))
+
+
+def write_json(results: List[BenchmarkResult], path: str) -> None:
+    with open(path, 'w') as f:
+        json.dump([asdict(result) for result in results], f, indent=2)
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(prog="python3 -m gui.benchmark",
+                                     description="Run nonogram solvers on a set of puzzles and record their timings")
+    parser.add_argument("--solvers", nargs="+", default=None,
+                        help="solver names in the solvers directory, or 'portfolio' to race all of them (default: all)")
+    parser.add_argument("--puzzles", nargs="+", default=DEFAULT_PUZZLE_DIRS,
+                        help="directories, single nonogram files or corpus archives (.ngc) to benchmark")
+    parser.add_argument("--timeout", type=float, default=60.0,
+                        help="per-puzzle solving timeout in seconds")
+    parser.add_argument("--no-unique", action="store_true",
+                        help="stop after the first model instead of checking uniqueness")
+    parser.add_argument("--all", action="store_true",
+                        help="enumerate all models")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="number of worker processes solving puzzles in parallel")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1],
+                        help="clingo solver threads per run; several values sweep over the thread counts")
+    parser.add_argument("--parallel-mode", choices=["compete", "split"], default="compete",
+                        help="clingo parallel mode used with more than one thread")
+    parser.add_argument("--no-propagation", action="store_true",
+                        help="do not fix the cells forced by line propagation before grounding")
+    parser.add_argument("--decode", type=int, default=None, metavar="SIZE",
+                        help="only run the model decoding microbenchmark on a SIZE x SIZE model")
+    parser.add_argument("--io", type=int, default=None, metavar="SIZE",
+                        help="only run the file saving/loading benchmark on a random SIZE x SIZE nonogram")
+    parser.add_argument("--csv", default=None, help="write the results to this CSV file")
+    parser.add_argument("--json", default=None, help="write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.decode:
+        run_decode_benchmark(args.decode)
+        return 0
+    if args.io:
+        run_io_benchmark(args.io)
+        return 0
+
+    solvers = args.solvers if args.solvers else list_solvers()
+    puzzles = find_puzzles([p for p in args.puzzles if not isfile(p)]) + [p for p in args.puzzles if isfile(p)]
+
+    results = run_benchmark(solvers, puzzles, args.timeout, not args.no_unique, args.all, args.jobs,
+                            args.threads, args.parallel_mode, not args.no_propagation)
+
+    if args.csv:
+        write_csv(results, args.csv)
+    if args.json:
+        write_json(results, args.json)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
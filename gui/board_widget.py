@@ -0,0 +1,289 @@
+# Nonogram board widget: grid, cross marks and hints painted with QPainter
+# Author: Fabian Kraus
+#
+# The board is painted in a single pass from the boolean grid, a boolean array of cross marks and the
+# hints; there are no objects per cell or hint. Changes to single cells, lines or
+# hints only repaint the rectangles they cover; Qt merges these and clips the paint event to them, and
+# painting only visits the cells and hints inside the clip rectangle.
+
+from math import floor
+from typing import List, Tuple
+
+import numpy as np
+
+from PyQt5.QtCore import QMarginsF, QPoint, QPointF, QRect, QRectF, QSize, QSizeF, Qt, pyqtSignal
+from PyQt5.QtGui import QColor, QFont, QImage, QPainter, QPaintDevice, QPdfWriter, QPen
+from PyQt5.QtWidgets import QSizePolicy, QWidget
+
+from .common import Nonogram
+
+FILL_COLOR = QColor(51, 51, 51) # black at 80% opacity on white
+HIGHLIGHT_FILL_COLOR = QColor(31, 31, 31) # black at 88% opacity on white, for the hovered row and column
+CROSS_COLOR = QColor(128, 128, 128)
+HINT_COLOR = QColor(0, 0, 0)
+WRONG_HINT_COLOR = QColor(255, 0, 0)
+ROW_HINT_SPACING = 0.7 # horizontal distance of row hints, in cells
+COL_HINT_SPACING = 0.8 # vertical distance of column hints, in cells
+MARGIN = 4 # pixels around the board
+
+class BoardWidget(QWidget):
+    # Mouse button pressed on a cell (row, col, button); row < 0 above the grid (column hints), col < 0 left of it (row hints)
+    cell_pressed = pyqtSignal(int, int, object)
+    mouse_released = pyqtSignal()
+    # Mouse moved over a grid cell (row, col)
+    cell_hovered = pyqtSignal(int, int)
+    # Mouse left the board (grid and hints)
+    board_left = pyqtSignal()
+
+    def __init__(self, parent: QWidget | None = None) -> None:
+        super().__init__(parent)
+        self.setMouseTracking(True)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+        self.width_, self.height_ = 0, 0
+        self.row_hints: List[List[int]] = []
+        self.col_hints: List[List[int]] = []
+        self.grid: np.ndarray = np.zeros((0, 0), dtype=bool)
+        self.crosses: np.ndarray = np.zeros((0, 0), dtype=bool)
+        # Per line, whether each hint (in hint order) is satisfied; unsatisfied hints are painted red
+        self.row_hints_ok: List[List[bool]] = []
+        self.col_hints_ok: List[List[bool]] = []
+        self.highlighted_row, self.highlighted_col = -1, -1
+
+    def set_nonogram(self, nonogram: Nonogram, show_feedback: bool) -> None:
+        """Show a new nonogram with an empty grid; all hints are marked unsatisfied if show_feedback is set"""
+        self.width_, self.height_ = nonogram.width, nonogram.height
+        # Lines without blocks show a single 0
+        self.row_hints = [list(hint) or [0] for hint in nonogram.row_hints]
+        self.col_hints = [list(hint) or [0] for hint in nonogram.col_hints]
+        self.grid = np.zeros((self.height_, self.width_), dtype=bool)
+        self.crosses = np.zeros((self.height_, self.width_), dtype=bool)
+        self.row_hints_ok = [[not show_feedback or l == 0 for l in hint] for hint in self.row_hints]
+        self.col_hints_ok = [[not show_feedback or l == 0 for l in hint] for hint in self.col_hints]
+        self.highlighted_row, self.highlighted_col = -1, -1
+        self.update()
+
+    def set_grid(self, grid: np.ndarray) -> None:
+        """Show the given grid (True: black) and remove all cross marks"""
+        self.grid = np.array(grid, dtype=bool)
+        self.crosses.fill(False)
+        self.update(self._grid_rect())
+
+    def set_cell(self, row: int, col: int, filled: bool) -> None:
+        self.grid[row, col] = filled
+        self.update(self._cell_rect(row, col))
+
+    def toggle_cross(self, row: int, col: int) -> None:
+        self.crosses[row, col] = not self.crosses[row, col]
+        self.update(self._cell_rect(row, col))
+
+    def set_row_feedback(self, row: int, hints_ok: List[bool]) -> None:
+        if hints_ok != self.row_hints_ok[row]:
+            self.row_hints_ok[row] = hints_ok
+            self.update(self._row_hint_rect(row))
+
+    def set_col_feedback(self, col: int, hints_ok: List[bool]) -> None:
+        if hints_ok != self.col_hints_ok[col]:
+            self.col_hints_ok[col] = hints_ok
+            self.update(self._col_hint_rect(col))
+
+    def set_highlight(self, row: int, col: int) -> None:
+        """Highlight the hints and filled cells of a row and a column (-1: none)"""
+        if (row, col) == (self.highlighted_row, self.highlighted_col):
+            return
+        for r in {self.highlighted_row, row}:
+            if 0 <= r < self.height_:
+                self.update(self._row_hint_rect(r).united(self._cell_rect(r, 0)).united(self._cell_rect(r, self.width_ - 1)))
+        for c in {self.highlighted_col, col}:
+            if 0 <= c < self.width_:
+                self.update(self._col_hint_rect(c).united(self._cell_rect(0, c)).united(self._cell_rect(self.height_ - 1, c)))
+        self.highlighted_row, self.highlighted_col = row, col
+
+    def export(self, file_path: str) -> None:
+        """Paint the board into an SVG, PDF or PNG file (by extension)"""
+        size = self.size()
+        if file_path.lower().endswith(".svg"):
+            from PyQt5.QtSvg import QSvgGenerator
+            device: QPaintDevice = QSvgGenerator()
+            device.setFileName(file_path)
+            device.setSize(size)
+            device.setViewBox(QRect(QPoint(0, 0), size))
+            self._paint_to(device, size)
+        elif file_path.lower().endswith(".pdf"):
+            dpi = self.logicalDpiX()
+            device = QPdfWriter(file_path)
+            device.setResolution(dpi)
+            device.setPageMargins(QMarginsF(0, 0, 0, 0))
+            device.setPageSizeMM(QSizeF(size.width() * 25.4 / dpi, size.height() * 25.4 / dpi))
+            self._paint_to(device, size)
+        else:
+            image = QImage(size, QImage.Format_RGB32)
+            self._paint_to(image, size)
+            image.save(file_path)
+
+    def _paint_to(self, device: QPaintDevice, size: QSize) -> None:
+        painter = QPainter(device)
+        try:
+            painter.setRenderHint(QPainter.Antialiasing)
+            self._paint(painter, QRect(QPoint(0, 0), size))
+        finally:
+            painter.end()
+
+    # Layout: the grid is placed right of the row hints and below the column hints, with square cells
+
+    def _hint_extent(self) -> Tuple[int, int]:
+        """Room for row hints (cells to the left) and column hints (cells above)"""
+        left = max((len(hint) for hint in self.row_hints), default=1)
+        top = max((len(hint) for hint in self.col_hints), default=1)
+        return left, top
+
+    def _layout(self) -> Tuple[float, float, float]:
+        """Cell size and top left corner of the grid, in pixels"""
+        if not self.width_ or not self.height_:
+            return 1.0, 0.0, 0.0
+        left, top = self._hint_extent()
+        cell = min((self.width() - 2 * MARGIN) / (self.width_ + left), (self.height() - 2 * MARGIN) / (self.height_ + top))
+        cell = max(cell, 1.0)
+        x0 = (self.width() - (self.width_ + left) * cell) / 2 + left * cell
+        y0 = (self.height() - (self.height_ + top) * cell) / 2 + top * cell
+        return cell, x0, y0
+
+    def cell_at(self, pos: QPoint) -> Tuple[int, int]:
+        """Row and column of the cell under a widget position (negative in the hint areas)"""
+        cell, x0, y0 = self._layout()
+        return floor((pos.y() - y0) / cell), floor((pos.x() - x0) / cell)
+
+    def _on_board(self, row: int, col: int) -> bool:
+        left, top = self._hint_extent()
+        return -top <= row < self.height_ and -left <= col < self.width_
+
+    def _cells_rect(self, row: int, col: int, rows: int, cols: int) -> QRect:
+        cell, x0, y0 = self._layout()
+        return QRectF(x0 + col * cell, y0 + row * cell, cols * cell, rows * cell).toAlignedRect().adjusted(-2, -2, 2, 2)
+
+    def _cell_rect(self, row: int, col: int) -> QRect:
+        return self._cells_rect(row, col, 1, 1)
+
+    def _grid_rect(self) -> QRect:
+        return self._cells_rect(0, 0, self.height_, self.width_)
+
+    def _row_hint_rect(self, row: int) -> QRect:
+        left, _ = self._hint_extent()
+        return self._cells_rect(row, -left, 1, left)
+
+    def _col_hint_rect(self, col: int) -> QRect:
+        _, top = self._hint_extent()
+        return self._cells_rect(-top, col, top, 1)
+
+    # Painting
+
+    def sizeHint(self) -> QSize:
+        return QSize(800, 600)
+
+    def paintEvent(self, event) -> None:
+        painter = QPainter(self)
+        try:
+            self._paint(painter, event.rect())
+        finally:
+            painter.end()
+
+    def _paint(self, painter: QPainter, clip: QRect) -> None:
+        painter.fillRect(clip, Qt.white)
+        if not self.width_ or not self.height_:
+            return
+        cell, x0, y0 = self._layout()
+
+        # Range of cells inside the clip rectangle
+        r0 = max(0, floor((clip.top() - y0) / cell))
+        r1 = min(self.height_, floor((clip.bottom() - y0) / cell) + 1)
+        c0 = max(0, floor((clip.left() - x0) / cell))
+        c1 = min(self.width_, floor((clip.right() - x0) / cell) + 1)
+
+        if r0 < r1 and c0 < c1:
+            self._paint_cells(painter, cell, x0, y0, r0, r1, c0, c1)
+            self._paint_crosses(painter, cell, x0, y0, r0, r1, c0, c1)
+
+            # Grid lines
+            painter.setPen(QPen(Qt.black, 1))
+            top, bottom = y0 + r0 * cell, y0 + r1 * cell
+            for c in range(c0, c1 + 1):
+                painter.drawLine(QPointF(x0 + c * cell, top), QPointF(x0 + c * cell, bottom))
+            left, right = x0 + c0 * cell, x0 + c1 * cell
+            for r in range(r0, r1 + 1):
+                painter.drawLine(QPointF(left, y0 + r * cell), QPointF(right, y0 + r * cell))
+
+        self._paint_hints(painter, clip, cell, x0, y0)
+
+    def _paint_cells(self, painter: QPainter, cell: float, x0: float, y0: float, r0: int, r1: int, c0: int, c1: int) -> None:
+        """Fill the black cells, one rectangle per run of black cells in a row"""
+        for r in range(r0, r1):
+            color = HIGHLIGHT_FILL_COLOR if r == self.highlighted_row else FILL_COLOR
+            line = np.concatenate(([False], self.grid[r, c0:c1], [False])).astype(np.int8)
+            edges = np.diff(line)
+            for start, stop in zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()):
+                painter.fillRect(QRectF(x0 + (c0 + start) * cell, y0 + r * cell, (stop - start) * cell, cell), color)
+        if c0 <= self.highlighted_col < c1:
+            c = self.highlighted_col
+            for r in (r0 + np.flatnonzero(self.grid[r0:r1, c])).tolist():
+                painter.fillRect(QRectF(x0 + c * cell, y0 + r * cell, cell, cell), HIGHLIGHT_FILL_COLOR)
+
+    def _paint_crosses(self, painter: QPainter, cell: float, x0: float, y0: float, r0: int, r1: int, c0: int, c1: int) -> None:
+        painter.setPen(QPen(CROSS_COLOR, max(1.0, cell / 15)))
+        inset = cell * 0.35
+        for r, c in (np.argwhere(self.crosses[r0:r1, c0:c1]) + (r0, c0)).tolist():
+            left, top = x0 + c * cell + inset, y0 + r * cell + inset
+            right, bottom = x0 + (c + 1) * cell - inset, y0 + (r + 1) * cell - inset
+            painter.drawLine(QPointF(left, top), QPointF(right, bottom))
+            painter.drawLine(QPointF(left, bottom), QPointF(right, top))
+
+    def _paint_hints(self, painter: QPainter, clip: QRect, cell: float, x0: float, y0: float) -> None:
+        """Row hints to the left of the grid (last hint next to it), column hints stacked above it"""
+        size = 0.75 * cell
+        fonts = {}
+        def font(pixels: float, bold: bool) -> QFont:
+            key = (max(1, round(pixels)), bold)
+            if key not in fonts:
+                fonts[key] = QFont()
+                fonts[key].setPixelSize(key[0])
+                fonts[key].setBold(bold)
+            return fonts[key]
+
+        box = QRectF(0, 0, cell, cell)
+        for r in range(self.height_):
+            if not clip.intersects(self._row_hint_rect(r)):
+                continue
+            bold = r == self.highlighted_row
+            for j, (l, ok) in enumerate(zip(reversed(self.row_hints[r]), reversed(self.row_hints_ok[r]))):
+                painter.setFont(font(size if l <= 9 else size / 2, bold))
+                painter.setPen(HINT_COLOR if ok else WRONG_HINT_COLOR)
+                box.moveCenter(QPointF(x0 - (0.66 + j * ROW_HINT_SPACING) * cell, y0 + (r + 0.6) * cell))
+                painter.drawText(box, Qt.AlignCenter, str(l))
+        for c in range(self.width_):
+            if not clip.intersects(self._col_hint_rect(c)):
+                continue
+            bold = c == self.highlighted_col
+            for i, (l, ok) in enumerate(zip(reversed(self.col_hints[c]), reversed(self.col_hints_ok[c]))):
+                painter.setFont(font(size if l <= 9 else 2 * size / 3, bold))
+                painter.setPen(HINT_COLOR if ok else WRONG_HINT_COLOR)
+                box.moveCenter(QPointF(x0 + (c + 0.5) * cell, y0 - (0.33 + i * COL_HINT_SPACING) * cell))
+                painter.drawText(box, Qt.AlignCenter, str(l))
+
+    # Mouse interaction
+
+    def mousePressEvent(self, event) -> None:
+        row, col = self.cell_at(event.pos())
+        self.cell_pressed.emit(row, col, event.button())
+
+    def mouseReleaseEvent(self, event) -> None:
+        self.mouse_released.emit()
+
+    def mouseMoveEvent(self, event) -> None:
+        row, col = self.cell_at(event.pos())
+        if not self._on_board(row, col):
+            self.board_left.emit()
+        elif 0 <= row < self.height_ and 0 <= col < self.width_:
+            self.cell_hovered.emit(row, col)
+
+    def leaveEvent(self, event) -> None:
+        self.board_left.emit()
@@ -1,9 +1,13 @@
 # ASP Nonogram viewer and solver GUI
 # Author: Fabian Kraus
 
+import hashlib
 from dataclasses import dataclass
-from typing import List, NewType, cast
-from clingo import Model
+from os.path import getmtime
+from itertools import chain
+from typing import Dict, Iterator, List, NewType, Tuple, cast
+from clingo import Control, Model, Symbol, SymbolicAtoms
+from clingo.ast import AST, ProgramBuilder, parse_files
 import numpy as np
 
 LineHint = NewType('LineHint', List[int])
@@ -29,6 +33,71 @@ def hint_from_line(line: np.ndarray) -> LineHint:
     return cast(LineHint, hint)
 
 
+class HintArray:
+    """Hints of all rows (or all columns) in compressed sparse row form: the blocks of line i are
+    lengths[offsets[i]:offsets[i+1]]. Lines keep the zero hints of the list form"""
+    __slots__ = ("lengths", "offsets")
+
+    def __init__(self, lengths: np.ndarray, offsets: np.ndarray):
+        self.lengths = lengths # int32 block lengths of all lines, one after the other
+        self.offsets = offsets # int64 start of every line in lengths, plus the total number of blocks
+
+    @classmethod
+    def from_lists(cls, hints: List[LineHint]) -> 'HintArray':
+        offsets = np.zeros(len(hints) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, hints), dtype=np.int64, count=len(hints)), out=offsets[1:])
+        lengths = np.fromiter(chain.from_iterable(hints), dtype=np.int32, count=int(offsets[-1]))
+        return cls(lengths, offsets)
+
+    @classmethod
+    def from_grid(cls, grid: np.ndarray) -> 'HintArray':
+        """Hints of all rows of a boolean grid (use grid.T for the columns), computed without a Python loop over the cells"""
+        height, width = grid.shape
+        padded = np.zeros((height, width + 2), dtype=np.int8)
+        padded[:, 1:-1] = grid
+        steps = np.diff(padded, axis=1)
+        starts = np.argwhere(steps == 1)
+        ends = np.argwhere(steps == -1)
+        rows = starts[:, 0]
+
+        # Every line without blocks gets a single zero hint
+        blocks_per_row = np.bincount(rows, minlength=height)
+        offsets = np.zeros(height + 1, dtype=np.int64)
+        np.cumsum(np.maximum(blocks_per_row, 1), out=offsets[1:])
+        first_block = np.cumsum(blocks_per_row) - blocks_per_row
+        lengths = np.zeros(offsets[-1], dtype=np.int32)
+        lengths[offsets[rows] + np.arange(len(rows)) - first_block[rows]] = ends[:, 1] - starts[:, 1]
+        return cls(lengths, offsets)
+
+    def to_lists(self) -> List[LineHint]:
+        flat = self.lengths.tolist()
+        bounds = self.offsets.tolist()
+        return [cast(LineHint, flat[start:stop]) for start, stop in zip(bounds, bounds[1:])]
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, line: int) -> np.ndarray:
+        """Blocks of a line, as a view into the flat array"""
+        return self.lengths[self.offsets[line]:self.offsets[line + 1]]
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        for line in range(len(self)):
+            yield self[line]
+
+    def line_sizes(self) -> np.ndarray:
+        """Number of hint entries of every line"""
+        return np.diff(self.offsets)
+
+    def asp_facts(self, predicate: str, separator: str = ",") -> str:
+        """One fact predicate(Line,Index,Length) per hint entry (1-based), formatted in a single pass"""
+        sizes = self.line_sizes()
+        lines = np.repeat(np.arange(1, len(self) + 1), sizes)
+        indices = np.arange(1, len(self.lengths) + 1) - np.repeat(self.offsets[:-1], sizes)
+        values = np.stack((lines, indices, self.lengths), axis=1).ravel().tolist()
+        return (f"{predicate}(%d{separator}%d{separator}%d).\n" * len(self.lengths)) % tuple(values)
+
+
 @dataclass
 class Nonogram:
     width : int
@@ -46,17 +115,27 @@ class Nonogram:
     def init_from_grid(self, grid: np.ndarray):
         self.width = grid.shape[1]
         self.height = grid.shape[0]
-        
-        self.row_hints = []
-        for row in grid:
-            hint = hint_from_line(row)
-            self.row_hints.append(cast(LineHint, hint))
-        
-        self.col_hints = []
-        for i in range(grid.shape[1]):
-            col = grid[:, i]
-            hint = hint_from_line(col)
-            self.col_hints.append(cast(LineHint, hint))
+        self.set_hint_arrays(HintArray.from_grid(grid), HintArray.from_grid(grid.T))
+
+    def hint_arrays(self) -> Tuple[HintArray, HintArray]:
+        """Row and column hints in compressed sparse row form (a snapshot, later edits of the lists are not reflected)"""
+        return HintArray.from_lists(self.row_hints), HintArray.from_lists(self.col_hints)
+
+    def set_hint_arrays(self, row_hints: HintArray, col_hints: HintArray) -> None:
+        """Replace the row and column hints by the ones in compressed sparse row form"""
+        self.row_hints = row_hints.to_lists()
+        self.col_hints = col_hints.to_lists()
+
+
+def canonical_hash(nonogram: Nonogram) -> str:
+    """Content hash of the size and the positive blocks of every line, so [0] and [] hints are the same (hex digest)"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.array([nonogram.width, nonogram.height], dtype=np.int64).tobytes())
+    for hints in (nonogram.row_hints, nonogram.col_hints):
+        blocks = HintArray.from_lists([[l for l in hint if l > 0] for hint in hints])
+        digest.update(blocks.line_sizes().tobytes())
+        digest.update(blocks.lengths.tobytes())
+    return digest.hexdigest()
 
 
 @dataclass
@@ -66,15 +145,22 @@ class NonogramSoln:
     def __init__(self, nonogram: Nonogram):
         self.grid = np.full((nonogram.height, nonogram.width), 0, dtype=np.bool)
 
-    def fill_from_model(self, model: Model | None):
+    def fill_from_model(self, model: Model | None, decoder: 'FillDecoder | None' = None):
         if not model:
             return
         
         self.grid.fill(0)
-        
-        for symbol in model.symbols(atoms=True):
-            if symbol.name == 'fill':
-                self.grid[symbol.arguments[0].number - 1, symbol.arguments[1].number - 1] = 1
+
+        if decoder:
+            decoder.decode(model, self.grid)
+            return
+
+        # All encodings only show fill/2, so the shown symbols are (nearly) just the black cells,
+        # which are collected first and written into the grid in one step
+        coords = [symbol.arguments for symbol in model.symbols(shown=True) if symbol.name == 'fill']
+        if coords:
+            cells = np.array([(r.number, c.number) for r, c in coords], dtype=np.intp) - 1
+            self.grid[cells[:, 0], cells[:, 1]] = 1
 
     def row_matches_hint(self, row_index: int, linehint: LineHint) -> bool:
         row = self.grid[row_index, :]
@@ -108,6 +194,44 @@ class NonogramSoln:
         curr_hint = hint_from_line(col)
         return matching_indices(linehint, curr_hint)
 
+class FillDecoder:
+    def __init__(self, symbolic_atoms: SymbolicAtoms, width: int):
+        """Map every ground fill/2 atom of a control to its flat grid index once, so decoding a model
+        only needs one dictionary lookup per black cell instead of unpacking every symbol's arguments"""
+        self.index: Dict[Symbol, int] = {}
+        for atom in symbolic_atoms.by_signature('fill', 2):
+            args = atom.symbol.arguments
+            self.index[atom.symbol] = (args[0].number - 1) * width + args[1].number - 1
+
+    def decode(self, model: Model, grid: np.ndarray) -> None:
+        """Set the cells of all fill atoms in the model in the (zeroed) grid"""
+        index = self.index
+        try:
+            cells = [index[symbol] for symbol in model.symbols(shown=True)]
+        except KeyError:
+            # Something besides fill/2 is shown
+            cells = [index[symbol] for symbol in model.symbols(shown=True) if symbol in index]
+        np.put(grid, cells, 1)
+
+# Parsed encodings by file path, with the modification time they were parsed at
+_encoding_cache: Dict[str, Tuple[float, List[AST]]] = {}
+
+def parse_encoding(path: str) -> List[AST]:
+    """Parsed statements of the logic program at the given path, parsed only once (and again after it changed on disk)"""
+    mtime = getmtime(path)
+    cached = _encoding_cache.get(path)
+    if cached is None or cached[0] != mtime:
+        statements: List[AST] = []
+        parse_files([path], statements.append)
+        cached = _encoding_cache[path] = (mtime, statements)
+    return cached[1]
+
+def load_encoding(ctl: Control, path: str) -> None:
+    """Add the logic program at the given path to the control, like ctl.load but from the parsed statement cache"""
+    with ProgramBuilder(ctl) as builder:
+        for statement in parse_encoding(path):
+            builder.add(statement)
+
 def matching_indices(expected: List[int], actual: List[int]) -> List[int]:
     len_actual = len(actual)
     len_expected = len(expected)
@@ -172,6 +296,33 @@ def matching_indices(expected: List[int], actual: List[int]) -> List[int]:
     # Ensure we have exactly len_actual indices; if not, return what we have
     return sorted(result)
 
+def correlated_noise(height: int, width: int, white_ratio: float, correlation: float, seed: int | None = None,
+                     steps: int = 3) -> np.ndarray:
+    """Random image (0: black, 255: white) with the given share of white pixels before smoothing. In each of the steps,
+    every pixel takes the majority color of its 4 neighbors (black on ties) with the given probability, all pixels at once.
+    The same seed gives the same image; None draws a new one"""
+    rng = np.random.default_rng(seed)
+    white = rng.random((height, width)) < white_ratio
+
+    neighbors = np.zeros((height, width), dtype=np.int8)
+    neighbors[1:, :] += 1
+    neighbors[:-1, :] += 1
+    neighbors[:, 1:] += 1
+    neighbors[:, :-1] += 1
+
+    count = np.empty((height, width), dtype=np.int8)
+    for _ in range(steps):
+        count.fill(0)
+        count[1:, :] += white[:-1, :]
+        count[:-1, :] += white[1:, :]
+        count[:, 1:] += white[:, :-1]
+        count[:, :-1] += white[:, 1:]
+        # Pixels without neighbors (1x1 images) keep their color
+        majority = np.where(neighbors > 0, 2 * count > neighbors, white)
+        white = np.where(rng.random((height, width)) < correlation, majority, white)
+
+    return np.where(white, 255, 0).astype(np.uint8)
+
 def format_time(t: float) -> str:
     if t > 60.0*60.0:
         return f"{t/(60.0*60.0):.2f}h"
@@ -0,0 +1,221 @@
+# Packed puzzle corpus: many nonograms in a single indexed, memory mapped archive
+# Author: Fabian Kraus
+# run with: python3 -m gui.corpus build CORPUS.ngc DIR_OR_FILE [...]
+#    e.g. : python3 -m gui.corpus build survey.ngc nonograms/survey_by_numbers_dataset
+#           python3 -m gui.corpus list survey.ngc
+#
+# Layout: 8 byte magic, 8 byte header length, a JSON header (ids, metadata and the dtype, shape and offset
+# of every array) and the arrays themselves, each aligned to 64 bytes. All hints of all puzzles are stored
+# as one compressed sparse row structure: lines first_line[i] .. first_line[i+1]-1 belong to puzzle i (its
+# rows, then its columns), and the blocks of line j are lengths[line_offsets[j]:line_offsets[j+1]].
+# Opening a corpus only reads the header; the arrays are memory mapped and a puzzle is assembled on access.
+
+import json
+import struct
+import sys
+from os import walk
+from os.path import basename, isdir, join, relpath, splitext
+from typing import Dict, List, Set, Tuple
+
+import numpy as np
+
+from .common import HintArray, Nonogram, canonical_hash
+from .handlers.nonogram_handler import NonogramHandler
+
+CORPUS_MAGIC = b"NGCORPUS"
+CORPUS_VERSION = 1
+CORPUS_EXTENSION = ".ngc"
+_ALIGNMENT = 64
+
+
+def _find_puzzle_files(sources: List[str]) -> List[Tuple[str, str]]:
+    """(id, path) of every .lp and .txt file in the given directories (recursively) and of the given files.
+    Ids are the paths relative to their source directory, without extension"""
+    found = []
+    for source in sources:
+        if not isdir(source):
+            found.append((splitext(basename(source))[0], source))
+            continue
+        for root, dirs, files in walk(source):
+            dirs.sort()
+            for f in sorted(files):
+                if f.split(".")[-1] in ("lp", "txt"):
+                    path = join(root, f)
+                    found.append((splitext(relpath(path, source))[0], path))
+    return found
+
+
+def compile_corpus(sources: List[str], path: str) -> Tuple[int, List[str]]:
+    """Parse all puzzle files of the given directories and files into a corpus archive at path.
+    Puzzles whose content hash was seen already are skipped. Return the number of stored puzzles
+    and the messages of the files that were skipped"""
+    ids: List[str] = []
+    metadata: List[Dict[str, str]] = []
+    hashes: List[bytes] = []
+    sizes: List[Tuple[int, int]] = []
+    row_arrays: List[HintArray] = []
+    col_arrays: List[HintArray] = []
+    seen: Dict[str, str] = {} # content hash -> id
+    used_ids: Set[str] = set()
+    skipped: List[str] = []
+
+    for puzzle_id, puzzle_path in _find_puzzle_files(sources):
+        handler = NonogramHandler()
+        try:
+            handler.load_file(puzzle_path)
+        except Warning as w:
+            skipped.append(f"{puzzle_path}: {w.args[0]}")
+            continue
+        nonogram = handler.get_curr_nonogram()
+        content_hash = canonical_hash(nonogram)
+        if content_hash in seen:
+            skipped.append(f"{puzzle_path}: same puzzle as '{seen[content_hash]}'")
+            continue
+        if puzzle_id in used_ids:
+            puzzle_id = splitext(puzzle_path)[0]
+        seen[content_hash] = puzzle_id
+        used_ids.add(puzzle_id)
+
+        ids.append(puzzle_id)
+        metadata.append({"source": puzzle_path})
+        hashes.append(bytes.fromhex(content_hash))
+        sizes.append((nonogram.width, nonogram.height))
+        rows, cols = nonogram.hint_arrays()
+        row_arrays.append(rows)
+        col_arrays.append(cols)
+
+    # Rows, then columns of every puzzle, one line after the other
+    line_arrays = [hints for pair in zip(row_arrays, col_arrays) for hints in pair]
+    line_sizes = np.concatenate([hints.line_sizes() for hints in line_arrays]) if line_arrays else np.empty(0, dtype=np.int64)
+    line_offsets = np.zeros(len(line_sizes) + 1, dtype=np.int64)
+    np.cumsum(line_sizes, out=line_offsets[1:])
+    lines_per_puzzle = np.array([w + h for w, h in sizes], dtype=np.int64)
+    first_line = np.zeros(len(ids) + 1, dtype=np.int64)
+    np.cumsum(lines_per_puzzle, out=first_line[1:])
+
+    arrays = {
+        "widths": np.array([w for w, _ in sizes], dtype=np.int32),
+        "heights": np.array([h for _, h in sizes], dtype=np.int32),
+        "hashes": np.frombuffer(b"".join(hashes), dtype=np.uint8).reshape(len(ids), 16),
+        "first_line": first_line,
+        "line_offsets": line_offsets,
+        "lengths": np.concatenate([hints.lengths for hints in line_arrays]) if line_arrays else np.empty(0, dtype=np.int32),
+    }
+    _write_archive(path, ids, metadata, arrays)
+    return len(ids), skipped
+
+
+def _write_archive(path: str, ids: List[str], metadata: List[Dict[str, str]], arrays: Dict[str, np.ndarray]) -> None:
+    # The array offsets depend on the header length, so the header is laid out with placeholders first
+    layout = {name: [array.dtype.str, list(array.shape), 0] for name, array in arrays.items()}
+    header = {"version": CORPUS_VERSION, "ids": ids, "metadata": metadata, "arrays": layout}
+    header_size = len(json.dumps(header).encode()) + 32 * len(arrays) # room for the offsets
+    offset = _align(len(CORPUS_MAGIC) + 8 + header_size)
+    for name, array in arrays.items():
+        layout[name][2] = offset
+        offset = _align(offset + array.nbytes)
+
+    encoded = json.dumps(header).encode()
+    assert len(encoded) <= header_size
+    encoded += b" " * (header_size - len(encoded))
+    with open(path, 'wb') as f:
+        f.write(CORPUS_MAGIC + struct.pack("<Q", header_size) + encoded)
+        for name, array in arrays.items():
+            f.write(b"\0" * (layout[name][2] - f.tell()))
+            f.write(np.ascontiguousarray(array).tobytes())
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class Corpus:
+    def __init__(self, path: str):
+        """Open a corpus archive: read its header and memory map its arrays (nothing else is read up front)"""
+        with open(path, 'rb') as f:
+            if f.read(len(CORPUS_MAGIC)) != CORPUS_MAGIC:
+                raise Warning(f"Not a nonogram corpus: {path}")
+            header_size, = struct.unpack("<Q", f.read(8))
+            header = json.loads(f.read(header_size))
+        if header["version"] != CORPUS_VERSION:
+            raise Warning(f"Unsupported corpus version {header['version']}")
+
+        self.path = path
+        self.ids: List[str] = header["ids"]
+        self.metadata: List[Dict[str, str]] = header["metadata"]
+        self._index = {puzzle_id: i for i, puzzle_id in enumerate(self.ids)}
+        self._arrays: Dict[str, np.ndarray] = {}
+        for name, (dtype, shape, offset) in header["arrays"].items():
+            if np.prod(shape) == 0:
+                # Empty arrays cannot be memory mapped
+                self._arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                self._arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=offset, shape=tuple(shape))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def index(self, key: int | str) -> int:
+        """Position of the puzzle with the given id (or position)"""
+        if isinstance(key, str):
+            if key not in self._index:
+                raise KeyError(f"No puzzle '{key}' in the corpus")
+            return self._index[key]
+        if not -len(self) <= key < len(self):
+            raise IndexError("puzzle index out of range")
+        return key % len(self)
+
+    def __getitem__(self, key: int | str) -> Nonogram:
+        """Assemble the puzzle with the given id or position from the memory mapped arrays"""
+        i = self.index(key)
+        nonogram = Nonogram()
+        nonogram.width, nonogram.height = self.size(i)
+        nonogram.set_hint_arrays(*self.hint_arrays(i))
+        return nonogram
+
+    def hint_arrays(self, key: int | str) -> Tuple[HintArray, HintArray]:
+        """Row and column hints of a puzzle as views into the memory mapped block lengths"""
+        i = self.index(key)
+        first = int(self._arrays["first_line"][i])
+        middle = first + int(self._arrays["heights"][i])
+        last = int(self._arrays["first_line"][i + 1])
+        return self._hints(first, middle), self._hints(middle, last)
+
+    def _hints(self, first: int, last: int) -> HintArray:
+        offsets = self._arrays["line_offsets"][first:last + 1]
+        lengths = self._arrays["lengths"][offsets[0]:offsets[-1]]
+        return HintArray(lengths, offsets - offsets[0])
+
+    def content_hash(self, key: int | str) -> str:
+        return bytes(self._arrays["hashes"][self.index(key)]).hex()
+
+    def size(self, key: int | str) -> Tuple[int, int]:
+        """(width, height) of a puzzle, without assembling it"""
+        i = self.index(key)
+        return int(self._arrays["widths"][i]), int(self._arrays["heights"][i])
+
+
+def is_corpus(path: str) -> bool:
+    return path.endswith(CORPUS_EXTENSION)
+
+
+def main(argv: List[str]) -> int:
+    if len(argv) >= 3 and argv[0] == "build":
+        count, skipped = compile_corpus(argv[2:], argv[1])
+        for message in skipped:
+            print(f"Skipped {message}", file=sys.stderr)
+        print(f"Wrote {count} puzzles to {argv[1]}")
+        return 0
+    if len(argv) == 2 and argv[0] == "list":
+        corpus = Corpus(argv[1])
+        for i, puzzle_id in enumerate(corpus.ids):
+            width, height = corpus.size(i)
+            print(f"{puzzle_id:<40} {width:>5}x{height:<5} {corpus.content_hash(i)}  {corpus.metadata[i]['source']}")
+        return 0
+    print("usage: python3 -m gui.corpus build CORPUS.ngc DIR_OR_FILE [...]\n"
+          "       python3 -m gui.corpus list CORPUS.ngc", file=sys.stderr)
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
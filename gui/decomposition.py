@@ -0,0 +1,158 @@
+# Decomposition of nonograms into independent sub-boards
+# Author: Fabian Kraus
+#
+# Two lines interact only through the cells they share that are still undecided. Rows and columns are
+# joined whenever such a cell connects them; every group of lines then spans a rectangle of the board.
+# The rectangles are grown until the cells around them are white (or the board edge), and rectangles
+# whose row or column ranges overlap are merged. Every remaining rectangle is a nonogram of its own:
+# the blocks of a line that lie outside of it are already decided and separated from it by a white cell,
+# so its hints are the remaining blocks. The solutions of the whole board are the decided cells together
+# with all combinations of the solutions of its parts.
+
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from .common import Nonogram, NonogramSoln, LineHint, hint_from_line
+from .propagation import UNKNOWN, WHITE, BLACK
+
+# Row and column range of a sub-board
+Part = Tuple[slice, slice]
+
+
+class _UnionFind:
+    def __init__(self, n: int):
+        self.parent = list(range(n))
+
+    def find(self, x: int) -> int:
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def union(self, x: int, y: int) -> None:
+        self.parent[self.find(x)] = self.find(y)
+
+
+def _known_grid(nonogram: Nonogram, grid: np.ndarray | None) -> np.ndarray:
+    """Copy of the known cells (default: none), with the lines without blocks set to white"""
+    known = np.full((nonogram.height, nonogram.width), UNKNOWN, dtype=np.int8) if grid is None else grid.copy()
+    for r, hint in enumerate(nonogram.row_hints):
+        if not any(l > 0 for l in hint):
+            known[r, :] = WHITE
+    for c, hint in enumerate(nonogram.col_hints):
+        if not any(l > 0 for l in hint):
+            known[:, c] = WHITE
+    return known
+
+
+def _merge_overlapping(boxes: List[List[int]], uf: _UnionFind, lo: int, hi: int) -> None:
+    """Join boxes whose ranges [box[lo], box[hi]) overlap"""
+    order = sorted(range(len(boxes)), key=lambda b: boxes[b][lo])
+    end = -1
+    prev = -1
+    for b in order:
+        if boxes[b][lo] < end:
+            uf.union(b, prev)
+        if boxes[b][hi] > end:
+            end, prev = boxes[b][hi], b
+
+
+def _grow(box: List[int], known: np.ndarray) -> bool:
+    """Extend the box [row start, row end, col start, col end) by one line on every side where a cell next to it
+    is not white; return whether it changed"""
+    r0, r1, c0, c1 = box
+    height, width = known.shape
+    if c0 > 0 and np.any(known[r0:r1, c0 - 1] != WHITE):
+        box[2] -= 1
+    if c1 < width and np.any(known[r0:r1, c1] != WHITE):
+        box[3] += 1
+    if r0 > 0 and np.any(known[r0 - 1, c0:c1] != WHITE):
+        box[0] -= 1
+    if r1 < height and np.any(known[r1, c0:c1] != WHITE):
+        box[1] += 1
+    return box != [r0, r1, c0, c1]
+
+
+def find_parts(nonogram: Nonogram, grid: np.ndarray | None = None) -> List[Part]:
+    """Split the undecided cells of the board into independent rectangles, given the known cells of the grid
+    (default: none). Cells outside of all parts are decided"""
+    known = _known_grid(nonogram, grid)
+    undecided = known == UNKNOWN
+
+    # Lines are connected by the undecided cells they share (rows: 0..h-1, columns: h..h+w-1)
+    h = nonogram.height
+    lines = _UnionFind(h + nonogram.width)
+    for r in range(h):
+        for c in np.flatnonzero(undecided[r]).tolist():
+            lines.union(r, h + c)
+
+    # Bounding box [row start, row end, col start, col end) of every group of lines
+    groups = {}
+    for r, c in np.argwhere(undecided).tolist():
+        box = groups.setdefault(lines.find(r), [r, r + 1, c, c + 1])
+        box[0], box[1] = min(box[0], r), max(box[1], r + 1)
+        box[2], box[3] = min(box[2], c), max(box[3], c + 1)
+    boxes = list(groups.values())
+
+    # Grow the boxes up to white borders and merge the ones that share rows or columns, until nothing changes
+    while True:
+        grown = False
+        for box in boxes:
+            while _grow(box, known):
+                grown = True
+        uf = _UnionFind(len(boxes))
+        _merge_overlapping(boxes, uf, 0, 1)
+        _merge_overlapping(boxes, uf, 2, 3)
+        merged = {}
+        for b, box in enumerate(boxes):
+            root = merged.setdefault(uf.find(b), list(box))
+            root[0], root[1] = min(root[0], box[0]), max(root[1], box[1])
+            root[2], root[3] = min(root[2], box[2]), max(root[3], box[3])
+        if len(merged) == len(boxes) and not grown:
+            break
+        boxes = list(merged.values())
+
+    boxes.sort()
+    return [(slice(r0, r1), slice(c0, c1)) for r0, r1, c0, c1 in boxes]
+
+
+def _inner_hint(hint: LineHint, line: np.ndarray, start: int, stop: int) -> LineHint:
+    """Hint of the cells start..stop-1 of a line whose other cells are decided and separated from them by white cells"""
+    blocks = [l for l in hint if l > 0]
+    before = len([l for l in hint_from_line(line[:start] == BLACK) if l > 0])
+    after = len([l for l in hint_from_line(line[stop:] == BLACK) if l > 0])
+    return blocks[before:len(blocks) - after] or [0]
+
+
+def sub_nonogram(nonogram: Nonogram, part: Part, grid: np.ndarray | None = None) -> Nonogram:
+    """The nonogram of a part, given the known cells of the grid it was found with"""
+    known = _known_grid(nonogram, grid)
+    rows, cols = part
+    sub = Nonogram()
+    sub.height = rows.stop - rows.start
+    sub.width = cols.stop - cols.start
+    sub.row_hints = [_inner_hint(nonogram.row_hints[r], known[r, :], cols.start, cols.stop)
+                     for r in range(rows.start, rows.stop)]
+    sub.col_hints = [_inner_hint(nonogram.col_hints[c], known[:, c], rows.start, rows.stop)
+                     for c in range(cols.start, cols.stop)]
+    return sub
+
+
+def stitch(nonogram: Nonogram, parts: List[Part], part_solutions: List[Iterable[NonogramSoln]],
+           grid: np.ndarray | None = None) -> Iterator[np.ndarray]:
+    """All combinations of the solutions of the parts, together with the black cells of the known grid,
+    as full boolean grids (the last part varies fastest). The solutions of a part (e.g. a SolutionStore)
+    are iterated again for every combination of the parts before it, so they are never all unpacked at once"""
+    full = np.zeros((nonogram.height, nonogram.width), dtype=bool) if grid is None else grid == BLACK
+
+    def combine(k: int) -> Iterator[np.ndarray]:
+        if k == len(parts):
+            yield full.copy()
+            return
+        rows, cols = parts[k]
+        for soln in part_solutions[k]:
+            full[rows, cols] = soln.grid
+            yield from combine(k + 1)
+
+    yield from combine(0)
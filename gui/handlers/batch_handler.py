@@ -0,0 +1,142 @@
+# ASP Nonogram viewer and solver GUI
+# Author: Fabian Kraus
+
+from gui.common import *
+from gui.handlers.solution_handler import SolutionHandler, SolverResult
+from gui.solution_cache import SolutionCache
+from gui.solution_store import SolutionStore
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+from multiprocessing import Process, Pipe, cpu_count
+from multiprocessing.connection import Connection, wait
+from typing import Dict, Iterator, List, Tuple
+
+BATCH_GRACE_TIME = 1.0 # seconds a worker gets beyond the timeout to start up and send its result before it is killed
+
+@dataclass
+class BatchResult:
+    index: int # position of the nonogram in the batch
+    solutions: SolutionStore
+    result: SolverResult
+    ground_time: float
+    solve_time: float
+    timed_out: bool
+
+Task = Tuple[int, Nonogram, str, bool, bool, float, int, str, bool, str | None, str]
+
+def _solve_task(task: Task, connection: Connection) -> None:
+    """Worker process entry point: solve a single nonogram with its own SolutionHandler (and clingo Control)
+    and send the BatchResult (or the exception that stopped it) back through the connection"""
+    try:
+        index, nonogram, solver_path, check_unique, all_models, timeout, threads, parallel_mode, use_propagation, cache_path, handoff_dir = task
+        soln_handler = SolutionHandler()
+        soln_handler.use_propagation = use_propagation
+        if cache_path:
+            soln_handler.cache = SolutionCache(cache_path)
+        soln_handler.give_nonogram(nonogram)
+        soln_handler.set_timeout(timeout)
+        soln_handler.set_threads(threads, parallel_mode)
+        result = soln_handler.run_solver(solver_path, check_unique, all_models)
+        soln_handler.solutions.handoff_dir = handoff_dir
+        connection.send(BatchResult(index, soln_handler.solutions, result,
+                                    soln_handler.ground_time, soln_handler.solve_time, soln_handler.timed_out))
+    except Exception as e:
+        connection.send(e)
+    finally:
+        connection.close()
+
+def _killed_result(task: Task, elapsed: float) -> BatchResult:
+    """Result of a task whose worker was killed at the deadline (e.g. while grounding)"""
+    index, nonogram, solver_path = task[:3]
+    message = f"Solver '{solver_path}' found no solutions after {format_time(elapsed)} (timeout)"
+    result = SolverResult(solver_path, message, 0, True, solve_time=elapsed)
+    return BatchResult(index, SolutionStore(nonogram), result, 0.0, elapsed, True)
+
+class BatchHandler:
+    def __init__(self):
+        """Init a handler that solves lists of nonograms in parallel worker processes, one per nonogram"""
+        self.timeout: float = 1.0
+        self.processes: int | None = None # None: one worker per CPU core
+        self.threads: int = 1 # clingo solver threads per worker
+        self.parallel_mode: str = "compete"
+        self.use_propagation: bool = True
+        self.cache_path: str | None = None # solution cache database shared by the workers (None: no cache)
+
+    def set_timeout(self, t: float) -> None:
+        """Set the maximum time the solver can take on a single nonogram before aborting"""
+        self.timeout = t
+
+    def set_processes(self, n: int | None) -> None:
+        """Set the number of worker processes, or None to use every CPU core"""
+        self.processes = n
+
+    def set_threads(self, n: int, mode: str | None = None) -> None:
+        """Set the number of clingo solver threads per worker and optionally the parallel mode ('compete' or 'split')"""
+        if mode is not None:
+            self.parallel_mode = mode
+        self.threads = max(1, n)
+
+    def run_batch(self, nonograms: List[Nonogram], solver_path: str = "sbs-improved",
+                  check_unique: bool = True, all_models: bool = False) -> Iterator[BatchResult]:
+        """Solve all nonograms in parallel and yield the results in the order they finish.
+        Every nonogram is solved in its own process, which is killed if it runs past the timeout (plus a grace time),
+        so a grounding that never ends cannot hold up the batch"""
+        # Spill files of the solutions sent back; removed with whatever was not taken over (e.g. a worker killed while sending)
+        handoff_dir = tempfile.mkdtemp()
+        tasks: List[Task] = [(i, nonogram, solver_path, check_unique, all_models, self.timeout, self.threads,
+                              self.parallel_mode, self.use_propagation, self.cache_path, handoff_dir)
+                             for i, nonogram in enumerate(nonograms)]
+        tasks.reverse() # taken from the end
+        workers = self.processes or cpu_count()
+        time_limit = self.timeout + BATCH_GRACE_TIME
+
+        # Worker process, task and start time, by the receiving end of the worker's pipe
+        running: Dict[Connection, Tuple[Process, Task, float]] = {}
+        try:
+            while tasks or running:
+                while tasks and len(running) < workers:
+                    task = tasks.pop()
+                    receiver, sender = Pipe(duplex=False)
+                    # Daemonic, so the worker solves in its own process and killing it stops grounding as well
+                    process = Process(target=_solve_task, args=(task, sender), daemon=True)
+                    process.start()
+                    sender.close()
+                    running[receiver] = (process, task, time.time())
+
+                next_deadline = min(start + time_limit for _, _, start in running.values())
+                for receiver in wait(list(running), timeout=max(0.0, next_deadline - time.time())):
+                    process, task, start = running.pop(receiver)
+                    try:
+                        result = receiver.recv()
+                    except EOFError:
+                        # The worker died without a result
+                        result = RuntimeError(f"Batch worker for nonogram {task[0]} exited with code {process.exitcode}")
+                    receiver.close()
+                    process.join()
+                    if isinstance(result, BaseException):
+                        raise result
+                    yield result
+
+                now = time.time()
+                for receiver, (process, task, start) in list(running.items()):
+                    if now - start >= time_limit:
+                        del running[receiver]
+                        process.kill()
+                        process.join()
+                        receiver.close()
+                        yield _killed_result(task, now - start)
+        finally:
+            for receiver, (process, _, _) in running.items():
+                process.kill()
+                process.join()
+                receiver.close()
+            shutil.rmtree(handoff_dir, ignore_errors=True)
+
+    def run_batch_ordered(self, nonograms: List[Nonogram], solver_path: str = "sbs-improved",
+                          check_unique: bool = True, all_models: bool = False) -> List[BatchResult]:
+        """Solve all nonograms in parallel and return the results in the order of the input list"""
+        results = list(self.run_batch(nonograms, solver_path, check_unique, all_models))
+        results.sort(key=lambda r: r.index)
+        return results
@@ -2,7 +2,32 @@
 # Author: Fabian Kraus
 
 from gui.common import *
+import re
+from array import array
 from io import TextIOWrapper
+from typing import Iterable, Iterator, TextIO
+
+READ_CHUNK_SIZE = 1 << 20 # characters read from instance files at once
+
+# Hint facts as written by save_file (and any other spacing); other hint lines are left to the line parser
+_HINT_FACTS = {kind: re.compile(rf"^[ \t]*{kind}_hint\([ \t]*(\d+)[ \t]*,[ \t]*(\d+)[ \t]*,[ \t]*(\d+)[ \t]*\)", re.M)
+               for kind in ("row", "col")}
+_HINT_HEADS = re.compile(r"^[ \t]*(?:row|col)_hint\(", re.M)
+
+def _line_chunks(file: TextIO, size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+    """Read the file in chunks of about the given size that end at a line break"""
+    rest = ""
+    while True:
+        chunk = file.read(size)
+        if not chunk:
+            break
+        chunk = rest + chunk
+        cut = chunk.rfind("\n") + 1
+        chunk, rest = chunk[:cut], chunk[cut:]
+        if chunk:
+            yield chunk
+    if rest:
+        yield rest
 
 class NonogramHandler:
     def __init__(self):
@@ -15,18 +40,57 @@ class NonogramHandler:
     
     def load_file(self, path: str) -> None:
         """Open the logic program file at the specified path and load the encoded nonogram"""
-        with open(path, 'r') as file:
-            lines = file.readlines()
         # check which file ending the filename has and switch between parsers
         lpfile = path.split('.')[-1] == 'lp'
         if not lpfile and path.split('.')[-1] != 'txt':
             raise Warning("File Format not supported")
-        
-        self.loaded_nonogram = self._load_lp_format(lines) if lpfile else self._load_txt_format(lines)
+
+        # The parsers consume the file while it is read in large chunks (text mode reads '\r\n' line endings as '\n')
+        with open(path, 'r', buffering=READ_CHUNK_SIZE) as file:
+            self.loaded_nonogram = self._load_lp_format(_line_chunks(file)) if lpfile else self._load_txt_format(file)
         self.loaded_nonogram_filename = path
 
-    def _load_lp_format(self, lines: list[str]) -> Nonogram:
+    def _load_lp_format(self, chunks: Iterable[str]) -> Nonogram:
         nonogram = Nonogram()
+        # (line, hint index, block length) triples of all hint facts, one array per chunk in file order
+        row_facts: List[np.ndarray] = []
+        col_facts: List[np.ndarray] = []
+
+        for chunk in chunks:
+            # Chunks with the dimensions or anything the patterns do not match go through the line parser
+            if '#const' in chunk or not self._parse_lp_hint_chunk(chunk, nonogram, row_facts, col_facts):
+                self._parse_lp_lines(chunk.splitlines(), nonogram, row_facts, col_facts)
+
+        if nonogram.width == 0 or nonogram.height == 0:
+            raise Warning(f"Nonogram dimensions are missing")
+
+        nonogram.set_hint_arrays(self._hints_from_facts(row_facts, nonogram.height),
+                                 self._hints_from_facts(col_facts, nonogram.width))
+        return nonogram
+
+    def _parse_lp_hint_chunk(self, chunk: str, nonogram: Nonogram,
+                             row_facts: List[np.ndarray], col_facts: List[np.ndarray]) -> bool:
+        """Extract all hint facts of the chunk with regular expressions and validate them at once.
+        Return False (and add nothing) if some hint line does not match or is out of range"""
+        found = []
+        for kind, limit in (("row", nonogram.height), ("col", nonogram.width)):
+            matches = _HINT_FACTS[kind].findall(chunk)
+            triples = np.fromstring(" ".join(map(" ".join, matches)), dtype=np.int64, sep=" ").reshape(-1, 3) \
+                if matches else np.empty((0, 3), dtype=np.int64)
+            if np.any((triples[:, 0] < 1) | (triples[:, 0] > limit) | (triples[:, 1] < 1)):
+                return False
+            found.append(triples)
+
+        if len(found[0]) + len(found[1]) != len(_HINT_HEADS.findall(chunk)):
+            return False
+        row_facts.append(found[0])
+        col_facts.append(found[1])
+        return True
+
+    def _parse_lp_lines(self, lines: Iterable[str], nonogram: Nonogram,
+                        row_facts: List[np.ndarray], col_facts: List[np.ndarray]) -> None:
+        rows = array('q')
+        cols = array('q')
 
         for line in lines:
             line = line.strip()
@@ -46,74 +110,70 @@ class NonogramHandler:
 
             elif line.startswith('row_hint('):
                 try:
-                    parts = line.split('(')[1].split(')')[0].split(',')
-                    row, hint_index, block_length = map(int, parts)
+                    row, hint_index, block_length = map(int, line.split('(')[1].split(')')[0].split(','))
                     assert(row > 0 and row <= nonogram.height)
                     assert(hint_index > 0)
                     assert(block_length >= 0)
                 except:
                     raise Warning(f"Invalid row hint: {line}")
-                while len(nonogram.row_hints) < nonogram.height:
-                    nonogram.row_hints.append(cast(LineHint, []))
-                while len(nonogram.row_hints[row - 1]) <= hint_index - 1:
-                    nonogram.row_hints[row - 1].append(0)
-                nonogram.row_hints[row - 1][hint_index - 1] = block_length
+                rows.extend((row, hint_index, block_length))
 
             elif line.startswith('col_hint('):
                 try:
-                    parts = line.split('(')[1].split(')')[0].split(',')
-                    col, hint_index, block_length = map(int, parts)
+                    col, hint_index, block_length = map(int, line.split('(')[1].split(')')[0].split(','))
                     assert(col > 0 and col <= nonogram.width)
                     assert(hint_index > 0)
                     assert(block_length >= 0)
                 except:
                     raise Warning(f"Invalid column hint: {line}")
-                while len(nonogram.col_hints) < nonogram.width:
-                    nonogram.col_hints.append(cast(LineHint, []))
-                while len(nonogram.col_hints[col - 1]) <= hint_index - 1:
-                    nonogram.col_hints[col - 1].append(0)
-                nonogram.col_hints[col - 1][hint_index - 1] = block_length
-
-        if nonogram.width == 0 or nonogram.height == 0:
-            raise Warning(f"Nonogram dimensions are missing")
-        
-        return nonogram
-    
-    def _load_txt_format(self, lines: list[str]) -> Nonogram:
+                cols.extend((col, hint_index, block_length))
+
+        row_facts.append(np.frombuffer(rows, dtype=np.int64).reshape(-1, 3))
+        col_facts.append(np.frombuffer(cols, dtype=np.int64).reshape(-1, 3))
+
+    @staticmethod
+    def _hints_from_facts(facts: List[np.ndarray], lines: int) -> HintArray:
+        """Place the hint facts of all lines at once; hint indices that were left out are zero, a repeated fact overrides the earlier one"""
+        triples = np.concatenate(facts) if facts else np.empty((0, 3), dtype=np.int64)
+        line = triples[:, 0] - 1
+        index = triples[:, 1] - 1
+
+        sizes = np.zeros(lines, dtype=np.int64)
+        np.maximum.at(sizes, line, index + 1)
+        offsets = np.zeros(lines + 1, dtype=np.int64)
+        np.cumsum(sizes, out=offsets[1:])
+        lengths = np.zeros(offsets[-1], dtype=np.int32)
+        lengths[offsets[line] + index] = triples[:, 2]
+        return HintArray(lengths, offsets)
+
+    def _load_txt_format(self, lines: Iterable[str]) -> Nonogram:
         nonogram = Nonogram()
+        # Row hints up to the first blank line, column hints after it
+        sections: Tuple[List[LineHint], List[LineHint]] = ([], [])
+        section = 0
 
-        try:
-            split_index = lines.index('\n')
-        except:
-            raise Warning("Expected a blank line separating column and row hints")
-
-        row_hint_lines = [line.strip() for line in lines[:split_index] if line.strip()]
-        col_hint_lines = [line.strip() for line in lines[split_index + 1:] if line.strip()]
-        if not row_hint_lines:
-            raise Warning("Expected at least one row hint")
-        if not col_hint_lines:
-            raise Warning("Expected at least one column hint")
-
-        nonogram.height, nonogram.width = len(row_hint_lines), len(col_hint_lines)
-
-        for row_index, line in enumerate(row_hint_lines, start=1):
+        for line in lines:
+            line = line.strip()
+            if not line:
+                section = 1
+                continue
             try:
                 hints = list(map(int, line.split()))
-                for hint in hints:
-                    assert(hint > 0)
+                assert(min(hints) >= 0)
             except:
-                raise Warning(f"Invalid hint in row {row_index}: {line}")
-            nonogram.row_hints.append(cast(LineHint, hints))
+                kind = "row" if section == 0 else "column"
+                raise Warning(f"Invalid hint in {kind} {len(sections[section]) + 1}: {line}")
+            sections[section].append(cast(LineHint, hints))
 
-        for col_index, line in enumerate(col_hint_lines, start=1):
-            try:
-                hints = list(map(int, line.split()))
-                for hint in hints:
-                    assert(hint > 0)
-            except:
-                raise Warning(f"Invalid hint in column {col_index}: {line}")
-            nonogram.col_hints.append(cast(LineHint, hints))
+        if section == 0:
+            raise Warning("Expected a blank line separating column and row hints")
+        nonogram.row_hints, nonogram.col_hints = sections
+        if not nonogram.row_hints:
+            raise Warning("Expected at least one row hint")
+        if not nonogram.col_hints:
+            raise Warning("Expected at least one column hint")
 
+        nonogram.height, nonogram.width = len(nonogram.row_hints), len(nonogram.col_hints)
         return nonogram
 
     def save_file(self, path: str = "") -> None:
@@ -140,29 +200,23 @@ class NonogramHandler:
                 print(f"unsupported file format: '.{filetype}'")
 
     def _write_lp_format(self, nonogram: Nonogram, f: TextIOWrapper) -> None:
-        f.write(f"%%% ASP Nonogram solver\n")
-        f.write(f"%%% Problem Instance encoding\n")
-        f.write(f"%%% {nonogram.width}x{nonogram.height} Nonogram\n")
-        f.write(f"#const w = {nonogram.width}.  % Size of the Nonogram (w x h bw image)\n")
-        f.write(f"#const h = {nonogram.height}.\n\n")
-        f.write(f"% Hints for rows\n")
-        f.write(f"% Format: row_hint(Row, HintIndex, BlockLength)\n")
-        for row_num, hints in enumerate(nonogram.row_hints, start=1):
-            for idx, length in enumerate(hints, start=1):
-                f.write(f"row_hint({row_num}, {idx}, {length}).\n")
-        f.write("\n% Hints for columns\n")
-        f.write("% Format: col_hint(Column, HintIndex, BlockLength)\n")
-        for col_num, hints in enumerate(nonogram.col_hints, start=1):
-            for idx, length in enumerate(hints, start=1):
-                f.write(f"col_hint({col_num}, {idx}, {length}).\n")
+        # The whole file is formatted in memory and written at once
+        row_hints, col_hints = nonogram.hint_arrays()
+        f.write(f"%%% ASP Nonogram solver\n"
+                f"%%% Problem Instance encoding\n"
+                f"%%% {nonogram.width}x{nonogram.height} Nonogram\n"
+                f"#const w = {nonogram.width}.  % Size of the Nonogram (w x h bw image)\n"
+                f"#const h = {nonogram.height}.\n\n"
+                f"% Hints for rows\n"
+                f"% Format: row_hint(Row, HintIndex, BlockLength)\n"
+                + row_hints.asp_facts("row_hint", ", ") +
+                "\n% Hints for columns\n"
+                "% Format: col_hint(Column, HintIndex, BlockLength)\n"
+                + col_hints.asp_facts("col_hint", ", "))
 
     def _write_txt_format(self, nonogram: Nonogram, f: TextIOWrapper) -> None:
-        for hints in nonogram.row_hints:
-            for len in hints:
-                f.write(str(len) + ' ')
-            f.write("\n")
-        f.write("\n")
-        for hints in nonogram.col_hints:
-            for len in hints:
-                f.write(str(len) + ' ')
-            f.write("\n")
+        # Every hint is followed by a space, as in the files written so far
+        lines = [" ".join(map(str, hints)) + (" \n" if hints else "\n") for hints in nonogram.row_hints]
+        lines.append("\n")
+        lines += [" ".join(map(str, hints)) + (" \n" if hints else "\n") for hints in nonogram.col_hints]
+        f.write("".join(lines))
@@ -0,0 +1,83 @@
+# ASP Nonogram viewer and solver GUI
+# Author: Fabian Kraus
+
+from gui.common import *
+from clingo import Control, Function, Number, SolveHandle, Symbol
+from typing import Callable, Dict, List, Tuple
+
+MULTISHOT_ENCODING = "solvers/multishot/block-start-multishot.lp"
+
+class SolverSession:
+    def __init__(self, width: int, height: int, args: List[str] = []):
+        """Init a persistent multi-shot clingo session for nonograms of the given size.
+        Line hints are grounded once per distinct hint and switched on and off with external atoms,
+        so re-solving after a hint edit reuses the existing ground program and learned nogoods"""
+        self.width = width
+        self.height = height
+        self.ctl = Control(args + ["-c", f"w={width}", "-c", f"h={height}"])
+        load_encoding(self.ctl, MULTISHOT_ENCODING)
+        self.ctl.ground([("base", [])])
+
+        # Grounded hint versions of every line and the currently active one
+        self.row_versions: List[Dict[Tuple[int, ...], int]] = [{} for _ in range(height)]
+        self.col_versions: List[Dict[Tuple[int, ...], int]] = [{} for _ in range(width)]
+        self.active_rows: List[int] = [-1] * height
+        self.active_cols: List[int] = [-1] * width
+        self.grounded_parts = 0 # number of line parts grounded over the session's lifetime
+        self.decoder: FillDecoder | None = None # fill atoms are all grounded in base, so the lookup never changes
+        self.interrupt_sent = False # an interrupt sent while no search runs stays pending until the next solve call
+
+    def set_nonogram(self, nonogram: Nonogram) -> None:
+        """Activate the hints of the given nonogram, grounding only hints this session has not seen before"""
+        assert nonogram.width == self.width and nonogram.height == self.height
+
+        parts = []
+        switches = []
+        for is_row, hints, versions, active in ((True, nonogram.row_hints, self.row_versions, self.active_rows),
+                                                (False, nonogram.col_hints, self.col_versions, self.active_cols)):
+            kind = "row" if is_row else "col"
+            for index, hint in enumerate(hints):
+                key = tuple(hint)
+                if key not in versions[index]:
+                    # New hint for this line: ground a new part together with its hint facts
+                    version = len(versions[index])
+                    versions[index][key] = version
+                    name = f"{kind}_hints_{index+1}_{version}"
+                    facts = "".join(f"{kind}_hint({index+1},{version},{i},{l})." for i, l in enumerate(hint, start=1))
+                    self.ctl.add(name, [], facts)
+                    parts.append((f"{kind}_line", [Number(index+1), Number(version)]))
+                    parts.append((name, []))
+                version = versions[index][key]
+                if active[index] != version:
+                    if active[index] >= 0:
+                        switches.append((Function(f"active_{kind}", [Number(index+1), Number(active[index])]), False))
+                    switches.append((Function(f"active_{kind}", [Number(index+1), Number(version)]), True))
+                    active[index] = version
+
+        if parts:
+            self.ctl.ground(parts)
+            self.grounded_parts += len(parts) // 2
+        for atom, value in switches:
+            self.ctl.assign_external(atom, value)
+
+    def get_decoder(self) -> FillDecoder:
+        """Fill atom lookup for fast model decoding, set up on first use"""
+        if self.decoder is None:
+            self.decoder = FillDecoder(self.ctl.symbolic_atoms, self.width)
+        return self.decoder
+
+    def interrupt(self) -> None:
+        """Stop the running search (thread-safe); an interrupt that finds no running search is cleared before the next one"""
+        self.interrupt_sent = True
+        self.ctl.interrupt()
+
+    def solve(self, num: int, on_model: Callable[[Model], None],
+              assumptions: List[Tuple[Symbol, bool]] = []) -> SolveHandle:
+        """Start an asynchronous search for num models (0: all) of the active hints"""
+        if self.interrupt_sent:
+            # A pending interrupt would stop this search at once, so use it up on a search that fails right away
+            # (assuming an atom that does not exist)
+            self.interrupt_sent = False
+            self.ctl.solve(assumptions=[(Function("clear_interrupt"), True)])
+        self.ctl.configuration.solve.models = str(num) # type: ignore
+        return self.ctl.solve(assumptions=assumptions, on_model=on_model, async_=True) # type: ignore
@@ -2,32 +2,200 @@
 # Author: Fabian Kraus
 
 from gui.common import *
-from clingo import Control
+from gui.propagation import propagate, propagation_facts, BLACK, WHITE
+from gui.native_solver import NativeSolver, allowed_start_facts
+from gui.solution_store import SolutionStore, DEFAULT_MEMORY_CAP
+from gui.decomposition import Part, find_parts, stitch, sub_nonogram
+from gui.solution_cache import SolutionCache, VERDICT_UNSAT, answers
+from gui.handlers.session_handler import SolverSession
+from clingo import Control, Function, Number, SolveHandle
+import shutil
+import tempfile
 import time
 from copy import deepcopy
-from typing import List, Tuple
+from dataclasses import dataclass
+from itertools import islice
+from multiprocessing import Pool, Process, Queue, TimeoutError, cpu_count, current_process
+from os import listdir
+from os.path import isfile, join
+from queue import Empty
+from typing import Callable, Dict, Iterable, List, Tuple
+
+SOLVER_DIR = "solvers/"
+NATIVE_SOLVER = "native-bitset" # solver name of the built-in line solver + backtracking engine (no clingo)
+MULTISHOT_SOLVER = "sbs-multishot" # solver name of the persistent multi-shot session (see session_handler.py)
+ALLOWED_START_SOLVERS = {"sbs-dp"} # encodings that pick block starts from precomputed allowed_start facts
+
+@dataclass
+class SolverResult:
+    solver: str
+    message: str # human readable outcome, as shown in the status bar
+    models: int = 0
+    timed_out: bool = False
+    limit_phase: str = "" # 'grounding' or 'solving' if the timeout was hit
+    propagation_time: float = 0.0
+    ground_time: float = 0.0
+    solve_time: float = 0.0
+    # clingo statistics (zero for the native solver and for runs stopped before clingo could report them)
+    ground_atoms: int = 0
+    ground_rules: int = 0
+    choices: int = 0
+    conflicts: int = 0
+    restarts: int = 0
+    # CPU times (all threads) of grounding, searching and converting the models
+    ground_cpu_time: float = 0.0
+    solve_cpu_time: float = 0.0
+    model_cpu_time: float = 0.0
+
+    def summary(self) -> str:
+        """One line summary of the ground program size and the search effort"""
+        return (f"{self.ground_atoms:,} atoms, {self.ground_rules:,} rules | {self.choices:,} choices, "
+                f"{self.conflicts:,} conflicts, {self.restarts:,} restarts | CPU ground {format_time(self.ground_cpu_time)}, "
+                f"solve {format_time(self.solve_cpu_time)}, models {format_time(self.model_cpu_time)}")
+
+def clingo_statistics(statistics: dict) -> Dict[str, int]:
+    """Ground program size and search counters from the statistics of a clingo control after solving"""
+    try:
+        lp = statistics["problem"]["lp"]
+        solvers = statistics["solving"]["solvers"]
+        return {"ground_atoms": int(lp["atoms"]), "ground_rules": int(lp["rules"]),
+                "choices": int(solvers["choices"]), "conflicts": int(solvers["conflicts"]),
+                "restarts": int(solvers["restarts"])}
+    except KeyError:
+        # The search was stopped before clingo preprocessed the program
+        return {}
+
+def list_solvers() -> List[str]:
+    """Names of all logic program solvers in the solvers directory, followed by the native solver"""
+    lp_solvers = sorted(f.split(".")[0] for f in listdir(SOLVER_DIR) if isfile(join(SOLVER_DIR, f)) and f.endswith(".lp"))
+    return lp_solvers + [MULTISHOT_SOLVER, NATIVE_SOLVER]
+
+def _portfolio_worker(solver_path: str, nonogram: Nonogram, check_unique: bool, all_models: bool,
+                      timeout: float, threads: int, parallel_mode: str, use_propagation: bool, handoff_dir: str,
+                      results: Queue) -> None:
+    """Portfolio process entry point: run one solver and send its result back to the racing handler"""
+    soln_handler = SolutionHandler()
+    soln_handler.use_propagation = use_propagation
+    soln_handler.give_nonogram(nonogram)
+    soln_handler.set_timeout(timeout)
+    soln_handler.set_threads(threads, parallel_mode)
+    result = soln_handler.run_solver(solver_path, check_unique, all_models)
+    soln_handler.solutions.handoff_dir = handoff_dir
+    results.put((solver_path, soln_handler.solutions, soln_handler.ground_time,
+                 soln_handler.solve_time, soln_handler.timed_out, result))
+
+def _solve_worker(solver_path: str, nonogram: Nonogram, args: List[str], all_models: bool, threads: int,
+                  parallel_mode: str, use_propagation: bool, messages: Queue) -> None:
+    """Isolated solving process entry point: ground and solve, reporting the phases and every model (bit-packed)
+    to the parent, which kills this process once the deadline is reached"""
+    try:
+        soln_handler = SolutionHandler()
+        soln_handler.give_nonogram(nonogram)
+        soln_handler.set_threads(threads, parallel_mode)
+        soln_handler.use_propagation = use_propagation
+        ctl = soln_handler._create_control(solver_path, args)
+
+        ground_start_time = time.time()
+        ground_start_cpu = time.process_time()
+        ctl.ground([("base", [])])
+        decoder = FillDecoder(ctl.symbolic_atoms, nonogram.width) if all_models else None
+        messages.put(("grounded", soln_handler.propagation_time, time.time() - ground_start_time,
+                      time.process_time() - ground_start_cpu))
+
+        model_cpu = [0.0]
+        def on_model(model: Model) -> None:
+            model_start_cpu = time.process_time()
+            soln = NonogramSoln(nonogram)
+            soln.fill_from_model(model, decoder)
+            messages.put(("model", np.packbits(soln.grid, axis=None)))
+            model_cpu[0] += time.process_time() - model_start_cpu
+        solve_start_cpu = time.process_time()
+        ctl.solve(on_model=on_model)
+        messages.put(("statistics", clingo_statistics(ctl.statistics), time.process_time() - solve_start_cpu, model_cpu[0]))
+        messages.put(("done",))
+    except RuntimeError as e:
+        messages.put(("error", str(e)))
+
+def _part_worker(task: Tuple[int, str, Nonogram, bool, bool, float, int, str, bool, str]) -> Tuple[int, SolutionStore, SolverResult]:
+    """Decomposition worker process entry point: solve one independent part of a nonogram"""
+    index, solver_path, nonogram, check_unique, all_models, timeout, threads, parallel_mode, use_propagation, handoff_dir = task
+    soln_handler = SolutionHandler()
+    soln_handler.use_propagation = use_propagation
+    soln_handler.give_nonogram(nonogram)
+    soln_handler.set_timeout(timeout)
+    soln_handler.set_threads(threads, parallel_mode)
+    result = soln_handler.run_solver(solver_path, check_unique, all_models)
+    soln_handler.solutions.handoff_dir = handoff_dir
+    return index, soln_handler.solutions, result
 
 class SolutionHandler:
     def __init__(self):
         """Init a handler that can be given nonograms to solve"""
         self.given_nonogram: Nonogram
-        self.solutions: List[NonogramSoln] = []
+        self.solution_memory_cap: int = DEFAULT_MEMORY_CAP # bytes of packed solutions and their index kept in memory before spilling to disk
+        self.solutions: SolutionStore = SolutionStore(Nonogram(), self.solution_memory_cap)
         self.curr_soln_idx: int = -1 # == -1 if in working solution
         self.working_soln: NonogramSoln
         self.timeout: float = 1.0
         self.found_all = False
+        self.threads: int = 1
+        self.parallel_mode: str = "compete" # clingo parallel mode: 'compete' or 'split'
+        self.use_propagation: bool = True # fix the cells forced by line solving before grounding
+        self.sessions: Dict[Tuple[int, int, int, str], SolverSession] = {} # multi-shot sessions per board size and thread setup
+        self.decoder: FillDecoder | None = None # fill atom lookup of the current control, only set up to enumerate all models
+
+        # Timings and timeout flag of the last run_solver call
+        self.propagation_time: float = 0.0
+        self.ground_time: float = 0.0
+        self.solve_time: float = 0.0
+        self.timed_out: bool = False
+        self.limit_phase: str = "" # pipeline phase that hit the timeout: 'grounding' or 'solving'
+        self.statistics: Dict[str, int] = {} # clingo ground program size and search counters (see clingo_statistics)
+        self.ground_cpu_time: float = 0.0
+        self.solve_cpu_time: float = 0.0
+        self.model_cpu_time: float = 0.0
+        self.result: SolverResult | None = None # summary of the last run
+        self.isolate_grounding: bool = True # ground and solve in a child process that is killed at the deadline
+        self.use_decomposition: bool = False # solve independent parts of the board in parallel processes
+        self.cache: SolutionCache | None = None # verdicts of nonograms solved before, checked before every run
+
+        # Streaming and cancellation, for running the solvers on a background thread
+        self.on_solution: Callable[[NonogramSoln], None] | None = None # called (on the solver thread) for every new solution
+        self.cancelled: bool = False # set by cancel(), cleared by whoever starts the next run
+        self._interrupt: Callable[[], None] | None = None # stops the search that is currently running
 
     def give_nonogram(self, nonogram: Nonogram) -> None:
         """Give a reference to a nonogram that will be solved when run_solver is called"""
         self.given_nonogram = nonogram
         self.curr_soln_idx = -1
-        self.solutions = []
+        self.solutions = SolutionStore(nonogram, self.solution_memory_cap)
         self.working_soln = NonogramSoln(nonogram)
 
     def set_timeout(self, t: float) -> None:
         """Set the maximum time the solver can take before aborting"""
         self.timeout = t
 
+    def set_threads(self, n: int, mode: str | None = None) -> None:
+        """Set the number of clingo solver threads and optionally the parallel mode ('compete' or 'split')"""
+        if mode is not None:
+            if mode not in ("compete", "split"):
+                raise ValueError(f"Unknown parallel mode '{mode}'")
+            self.parallel_mode = mode
+        self.threads = max(1, n)
+
+    def cancel(self) -> None:
+        """Stop the running solver right away (thread-safe); the solutions found so far are kept"""
+        self.cancelled = True
+        interrupt = self._interrupt
+        if interrupt:
+            interrupt()
+
+    def _set_interrupt(self, interrupt: Callable[[], None]) -> None:
+        """Register how to stop the search that is about to run; a cancel that came before applies right away"""
+        self._interrupt = interrupt
+        if self.cancelled:
+            interrupt()
+
     def get_curr_soln(self) -> NonogramSoln:
         """Get the currently selected solution; use use_working_soln, next_soln or prev_soln methods to switch between solution"""
         if self.curr_soln_idx < 0:
@@ -57,78 +225,569 @@ class SolutionHandler:
         if self.curr_soln_idx < 0:
             self.curr_soln_idx = len(self.solutions) - 1
 
-    def get_cautious_pixels(self) -> np.ndarray:
-        """Find all solutions if not done already and return the coordinates of the pixels that are filled in every solution"""
-        if not self.found_all:
-            # If we did not find all solutions previously, do it now
-            self.run_solver_auto(True, True)
+    def get_cautious_pixels(self) -> np.ndarray | None:
+        """Return the pixels that are filled in every solution (None if the nonogram has no solution or the computation timed out)"""
+        if self.found_all and not self.timed_out and self.solutions:
+            # All solutions are known already, so just intersect them (on the packed grids)
+            return self.solutions.intersection()
+
+        determined = self.get_determined_pixels()
+        return determined[0] if determined else None
+
+    def get_determined_pixels(self, solver_path: str = "sbs-improved") -> Tuple[np.ndarray, np.ndarray] | None:
+        """Compute the pixels that are black in every solution and the pixels that are white in every solution,
+        using clingo's cautious and brave consequences instead of enumerating all solutions.
+        Returns None if the nonogram has no solution or the computation timed out or was cancelled
+        (a cancel is cleared by the caller before the next run)"""
+        if not self.given_nonogram:
+            return None
+        if solver_path in (NATIVE_SOLVER, MULTISHOT_SOLVER):
+            solver_path = "sbs-improved"
 
-        grids = [solution.grid for solution in self.solutions]
-        stacked_grids = np.stack(grids, axis=0)
-        common_grid = np.logical_and.reduce(stacked_grids, axis=0)
-        return common_grid
+        entry = self.cache.lookup(self.given_nonogram) if self.cache else None
+        if entry is not None:
+            if entry.verdict == VERDICT_UNSAT:
+                return None
+            if entry.cautious is not None:
+                return entry.cautious, ~entry.brave
+
+        consequences = []
+        deadline = time.time() + self.timeout
+        for mode in ("cautious", "brave"):
+            # Every model is a closer approximation of the consequences, so only the last one matters
+            last: List[NonogramSoln] = []
+            if self._solve_until(solver_path, ["0", "--enum-mode", mode], False, deadline, last.append):
+                return None
+            if self.cancelled:
+                # The last model is only an approximation of the consequences, so it must not be returned or cached
+                return None
+            if not last:
+                return None
+            consequences.append(last[-1].grid)
+
+        cautious, brave = consequences
+        if self.cache:
+            self.cache.store_consequences(self.given_nonogram, cautious, brave, solver_path)
+        return cautious, ~brave
     
-    def run_solver_auto(self, check_unique: bool = True, all_models: bool = False) -> str:
+    def run_solver_auto(self, check_unique: bool = True, all_models: bool = False) -> SolverResult:
         """Auto-select the best solver and run it"""
         return self.run_solver("sbs-improved", check_unique, all_models)
 
-    def run_solver(self, solver_path: str, check_unique: bool = True, all_models: bool = False) -> str:
+    def run_solver_portfolio(self, check_unique: bool = True, all_models: bool = False, solvers: List[str] | None = None) -> SolverResult:
+        """Race several solvers (default: all in the solvers directory) in separate processes, keep the first conclusive result and stop the others"""
+        if not self.given_nonogram:
+            print("Error: No nonogram to solve")
+            self.curr_soln_idx = 0
+            self.solutions.clear()
+            return SolverResult("", "Error: No nonogram to solve")
+
+        if solvers is None:
+            solvers = list_solvers()
+
+        start_time = time.time()
+        self._reset_statistics()
+        if self.cache and self._load_cached(check_unique, all_models):
+            return self.result
+
+        results: Queue = Queue()
+        # Spill files of the solutions sent back; removed with whatever was not taken over (e.g. results left queued)
+        handoff_dir = tempfile.mkdtemp()
+        processes = [Process(target=_portfolio_worker, daemon=True,
+                             args=(solver, self.given_nonogram, check_unique, all_models, self.timeout,
+                                   self.threads, self.parallel_mode, self.use_propagation, handoff_dir, results))
+                     for solver in solvers]
+        for process in processes:
+            process.start()
+
+        # Wait for the first result that did not time out; otherwise keep the one with the most models
+        best = None
+        received = 0
+        failed = set() # workers that died without posting a result
+        try:
+            while received < len(processes) and not self.cancelled:
+                remaining = self.timeout - (time.time() - start_time)
+                if remaining <= 0:
+                    break
+                try:
+                    # Poll in short steps, so cancel() stops the race promptly
+                    result = results.get(timeout=min(remaining, 0.1))
+                except Empty:
+                    # A worker that raised or was killed never posts its result: count it as an inconclusive one
+                    for i, process in enumerate(processes):
+                        if i not in failed and process.exitcode not in (None, 0):
+                            failed.add(i)
+                            received += 1
+                    continue
+                received += 1
+                if best is None or len(result[1]) > len(best[1]):
+                    best = result
+                if not result[4]:
+                    best = result
+                    break
+        finally:
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+            for process in processes:
+                process.join()
+            shutil.rmtree(handoff_dir, ignore_errors=True)
+        end_time = time.time()
+
+        self.curr_soln_idx = -1
+        self.propagation_time = 0.0
+        if best is None:
+            self.solutions.clear()
+            self.ground_time, self.solve_time, self.timed_out = 0.0, end_time - start_time, True
+            winner = "portfolio"
+        else:
+            winner, self.solutions, self.ground_time, self.solve_time, self.timed_out, winner_result = best
+            winner = f"portfolio/{winner}"
+            self.statistics = {key: getattr(winner_result, key) for key in
+                               ("ground_atoms", "ground_rules", "choices", "conflicts", "restarts")}
+            self.propagation_time = winner_result.propagation_time
+            self.ground_cpu_time = winner_result.ground_cpu_time
+            self.solve_cpu_time = winner_result.solve_cpu_time
+            self.model_cpu_time = winner_result.model_cpu_time
+        self.timed_out = self.timed_out or self.cancelled
+        self.limit_phase = ""
+        if self.solutions:
+            self.curr_soln_idx = 0
+        self.found_all = all_models and not self.timed_out
+
+        result = self._report(winner, end_time - start_time, check_unique, all_models)
+        self._save_to_cache(result, check_unique, all_models)
+        return result
+
+    def run_solver(self, solver_path: str, check_unique: bool = True, all_models: bool = False) -> SolverResult:
         """Run the logic program at the given path, assume it is a nonogram solver and try to find one/two models, depending on the check_unique flag"""
         if not self.given_nonogram:
             print("Error: No nonogram to solve")
             self.curr_soln_idx = 0
-            self.solutions = []
-            return "Error: No nonogram to solve"
+            self.solutions.clear()
+            return SolverResult("", "Error: No nonogram to solve")
+
+        self._reset_statistics()
+        if self.cache and self._load_cached(check_unique, all_models):
+            return self.result
+
+        result = self._run_solver(solver_path, check_unique, all_models)
+        self._save_to_cache(result, check_unique, all_models)
+        return result
+
+    def _run_solver(self, solver_path: str, check_unique: bool, all_models: bool) -> SolverResult:
+        if self.use_decomposition:
+            start_time = time.time()
+            known = None
+            if self.use_propagation:
+                prop = propagate(self.given_nonogram)
+                known = prop.grid if prop.consistent else None
+            parts = find_parts(self.given_nonogram, known)
+            self.propagation_time = time.time() - start_time
+            if len(parts) > 1:
+                return self._run_decomposed(solver_path, parts, known, check_unique, all_models, start_time)
+
+        if solver_path == NATIVE_SOLVER:
+            return self._run_native_solver(check_unique, all_models)
+        if solver_path == MULTISHOT_SOLVER:
+            return self._run_multishot_solver(check_unique, all_models)
 
-        # Initialize the clingo control and give the dimensional constants
         num = 1
         if check_unique:
             num = 2
         if all_models:
             num = 0
-        ctl = Control([f"{num}", 
-                       "-c", f"w={self.given_nonogram.width}", 
-                       "-c", f"h={self.given_nonogram.height}"])
-
-        # Add the hint predicates to the base program
-        for row_index, row in enumerate(self.given_nonogram.row_hints):
-            for hint_index, hint_length in enumerate(row):
-                ctl.add(f"row_hint({row_index+1},{hint_index+1},{hint_length}).")
-        for col_index, col in enumerate(self.given_nonogram.col_hints):
-            for hint_index, hint_length in enumerate(col):
-                ctl.add(f"col_hint({col_index+1},{hint_index+1},{hint_length}).")
-        
-        # Load the solver file and ground the program
-        ctl.load("solvers/" + solver_path + ".lp")
 
+        # One deadline for the whole pipeline: propagation, grounding and solving
         start_time = time.time()
-        ctl.ground([("base", [])])
-        ground_time = time.time()
+        self.solutions.clear()
+        self.curr_soln_idx = -1
+        self.limit_phase = self._solve_until(solver_path, [f"{num}"], all_models, start_time + self.timeout,
+                                             self._store_solution)
+        end_time = time.time()
+
+        if self.solutions:
+            self.curr_soln_idx = 0
+
+        if all_models:
+            self.found_all = True
+        else:
+            self.found_all = False
+
+        self.timed_out = bool(self.limit_phase) or self.cancelled
+
+        return self._report(solver_path, end_time - start_time, check_unique, all_models)
+
+    def _run_decomposed(self, solver_path: str, parts: List[Part], known: np.ndarray | None,
+                        check_unique: bool, all_models: bool, start_time: float) -> SolverResult:
+        """Solve the independent parts of the given nonogram in parallel processes and combine their solutions.
+        The number of solutions of the board is the product of the numbers of solutions of its parts"""
+        num = 1
+        if check_unique:
+            num = 2
+        if all_models:
+            num = 0
 
-        # Find the models and track the computation times
+        deadline = start_time + self.timeout
         self.solutions.clear()
         self.curr_soln_idx = -1
-        timed_out = False
+        self.ground_time, self.solve_time = 0.0, 0.0
 
-        with ctl.solve(async_=True, on_model=self._on_model) as handle:
-            while not handle.wait(1.0):
-                if time.time() - ground_time > self.timeout:
-                    handle.cancel()
-                    timed_out = True
+        part_solutions: List[Iterable[NonogramSoln]] = [[] for _ in parts]
+        results: List[Tuple[int, SolutionStore, SolverResult]] = []
+        # Spill files of the part solutions sent back; removed with whatever was not taken over
+        with tempfile.TemporaryDirectory() as handoff_dir:
+            tasks = [(index, solver_path, sub_nonogram(self.given_nonogram, part, known), check_unique, all_models,
+                      deadline - time.time(), self.threads, self.parallel_mode, self.use_propagation, handoff_dir)
+                     for index, part in enumerate(parts)]
+            if tasks:
+                pool = Pool(min(len(tasks), cpu_count()))
+                try:
+                    pending = pool.imap_unordered(_part_worker, tasks)
+                    while len(results) < len(tasks) and not self.cancelled:
+                        remaining = deadline - time.time()
+                        if remaining <= 0:
+                            break
+                        try:
+                            # Poll in short steps, so cancel() stops the parts promptly
+                            results.append(pending.next(timeout=min(remaining, 0.1)))
+                        except TimeoutError:
+                            continue
+                        # Without solutions for one part, the whole board has none
+                        if not results[-1][1]:
+                            break
+                finally:
+                    pool.terminate()
+                    pool.join()
+
+        # The parts ran side by side: wall times are the longest part's, counters and CPU times add up
+        for index, store, result in results:
+            part_solutions[index] = store
+            self.ground_time = max(self.ground_time, result.ground_time)
+            self.solve_time = max(self.solve_time, result.solve_time)
+            for key in ("ground_atoms", "ground_rules", "choices", "conflicts", "restarts"):
+                self.statistics[key] = self.statistics.get(key, 0) + getattr(result, key)
+            self.ground_cpu_time += result.ground_cpu_time
+            self.solve_cpu_time += result.solve_cpu_time
+            self.model_cpu_time += result.model_cpu_time
+
+        for grid in islice(stitch(self.given_nonogram, parts, part_solutions, known), num or None):
+            if self.cancelled:
+                break
+            soln = NonogramSoln(self.given_nonogram)
+            soln.grid[:, :] = grid
+            self._store_solution(soln)
+        end_time = time.time()
+
+        if self.solutions:
+            self.curr_soln_idx = 0
+
+        unsolvable = any(not store and not result.timed_out for _, store, result in results)
+        unfinished = len(results) < len(tasks) or any(result.timed_out for _, _, result in results)
+        self.timed_out = self.cancelled or (unfinished and not unsolvable)
+        self.limit_phase = "" if not self.timed_out else \
+            next((result.limit_phase for _, _, result in results if result.timed_out), "")
+        self.found_all = all_models and not self.timed_out
+
+        return self._report(f"{solver_path} ({len(parts)} parts)", end_time - start_time, check_unique, all_models)
+
+    def _solve_until(self, solver_path: str, args: List[str], all_models: bool, deadline: float,
+                     on_soln: Callable[[NonogramSoln], None]) -> str:
+        """Ground and solve the logic program, passing every model to on_soln, until the deadline.
+        Sets the phase timings and returns the phase that hit the deadline ('' if it finished in time)"""
+        # Worker processes of a pool or portfolio are daemonic and cannot start a child process of their own
+        if self.isolate_grounding and not current_process().daemon:
+            return self._solve_isolated(solver_path, args, all_models, deadline, on_soln)
+        return self._solve_in_process(solver_path, args, all_models, deadline, on_soln)
+
+    def _solve_isolated(self, solver_path: str, args: List[str], all_models: bool, deadline: float,
+                        on_soln: Callable[[NonogramSoln], None]) -> str:
+        """Ground and solve in a child process, so grounding can be stopped at the deadline by killing it"""
+        start_time = time.time()
+        # Forked children inherit the parsed encoding, so it is parsed once here instead of in every child
+        parse_encoding(SOLVER_DIR + solver_path + ".lp")
+        messages: Queue = Queue()
+        process = Process(target=_solve_worker, daemon=True,
+                          args=(solver_path, self.given_nonogram, args, all_models, self.threads, self.parallel_mode,
+                                self.use_propagation, messages))
+        # Cancelling wakes up the waiting loop below right away
+        self._set_interrupt(lambda: messages.put(("cancelled",)))
+        process.start()
+
+        width, height = self.given_nonogram.width, self.given_nonogram.height
+        self.propagation_time = 0.0
+        ground_time = None
+        phase = "grounding"
+        error = ""
+        try:
+            while not self.cancelled:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    message = messages.get(timeout=min(remaining, 1.0))
+                except Empty:
+                    if not process.is_alive():
+                        error = "Solver process exited unexpectedly"
+                        phase = ""
+                        break
+                    continue
+                if message[0] == "grounded":
+                    ground_time = time.time()
+                    self.propagation_time = message[1]
+                    self.ground_time = message[2]
+                    self.ground_cpu_time = message[3]
+                    phase = "solving"
+                elif message[0] == "model":
+                    model_start_cpu = time.process_time()
+                    soln = NonogramSoln(self.given_nonogram)
+                    soln.grid[:, :] = np.unpackbits(message[1], count=width * height).reshape(height, width)
+                    on_soln(soln)
+                    self.model_cpu_time += time.process_time() - model_start_cpu
+                elif message[0] == "statistics":
+                    self.statistics = message[1]
+                    self.solve_cpu_time = message[2]
+                    self.model_cpu_time += message[3]
+                elif message[0] == "error":
+                    error = message[1]
+                    phase = ""
+                    break
+                elif message[0] == "done":
+                    phase = ""
                     break
+        finally:
+            self._interrupt = None
+            if process.is_alive():
+                process.kill()
+            process.join()
+        end_time = time.time()
+
+        if ground_time is None:
+            self.ground_time = end_time - start_time
+            self.solve_time = 0.0
+        else:
+            self.solve_time = end_time - ground_time
+        if error:
+            raise RuntimeError(error)
+        return "" if self.cancelled else phase
+
+    def _solve_in_process(self, solver_path: str, args: List[str], all_models: bool, deadline: float,
+                          on_soln: Callable[[NonogramSoln], None]) -> str:
+        """Ground and solve in this process; grounding cannot be interrupted, the solving is cancelled right at the deadline"""
+        ctl = self._create_control(solver_path, args)
+        # An interrupt before solving stops the next solve call right at its beginning
+        self._set_interrupt(ctl.interrupt)
+
+        ground_start_time = time.time()
+        ground_start_cpu = time.process_time()
+        ctl.ground([("base", [])])
+        # Setting up the lookup costs about as much as decoding one model, so it only pays off when enumerating
+        decoder = FillDecoder(ctl.symbolic_atoms, self.given_nonogram.width) if all_models else None
+        ground_time = time.time()
+        self.ground_time = ground_time - ground_start_time
+        self.ground_cpu_time = time.process_time() - ground_start_cpu
+
+        def on_model(model: Model) -> None:
+            model_start_cpu = time.process_time()
+            soln = NonogramSoln(self.given_nonogram)
+            soln.fill_from_model(model, decoder)
+            on_soln(soln)
+            self.model_cpu_time += time.process_time() - model_start_cpu
+
+        phase = "grounding" if ground_time >= deadline else ""
+        if not phase:
+            solve_start_cpu = time.process_time()
+            with ctl.solve(async_=True, on_model=on_model) as handle:
+                if not self._wait(handle, deadline):
+                    handle.cancel()
+                    phase = "solving"
+            self.solve_cpu_time = time.process_time() - solve_start_cpu
+            self.statistics = clingo_statistics(ctl.statistics)
+        self._interrupt = None
+        self.solve_time = time.time() - ground_time
+        return "" if self.cancelled else phase
+
+    def _wait(self, handle: SolveHandle, deadline: float) -> bool:
+        """Wait for the search to finish until the deadline; return False if it is still running"""
+        remaining = deadline - time.time()
+        if remaining == float('inf'):
+            handle.wait()
+            return True
+        return handle.wait(max(remaining, 0.0))
 
+    def _create_control(self, solver_path: str, args: List[str]) -> Control:
+        """Create a clingo control with the given arguments, add the hints and propagated cells of the given nonogram and load the solver"""
+        # Initialize the clingo control and give the dimensional constants
+        args = args + ["-c", f"w={self.given_nonogram.width}", 
+                       "-c", f"h={self.given_nonogram.height}"]
+        if self.threads > 1:
+            args += ["-t", f"{self.threads},{self.parallel_mode}"]
+        ctl = Control(args)
+
+        # Add the hint predicates to the base program, all in one program string
+        row_hints, col_hints = self.given_nonogram.hint_arrays()
+        ctl.add("base", [], row_hints.asp_facts("row_hint") + col_hints.asp_facts("col_hint"))
+        
+        # Add the cells forced by line propagation (a contradiction is left for the solver to detect)
+        propagation_start_time = time.time()
+        known = None
+        if self.use_propagation:
+            prop = propagate(self.given_nonogram)
+            if prop.consistent:
+                ctl.add(propagation_facts(prop, self.given_nonogram))
+                known = prop.grid
+
+        # Exact start positions of every block from the line dynamic program, given the propagated cells
+        if solver_path in ALLOWED_START_SOLVERS:
+            ctl.add(allowed_start_facts(self.given_nonogram, known))
+        self.propagation_time = time.time() - propagation_start_time
+
+        # Load the solver file (parsed once per process)
+        load_encoding(ctl, SOLVER_DIR + solver_path + ".lp")
+        return ctl
+
+    def _run_multishot_solver(self, check_unique: bool, all_models: bool) -> SolverResult:
+        """Solve the given nonogram in the persistent multi-shot session for its size, grounding only changed hints"""
+        num = 1
+        if check_unique:
+            num = 2
+        if all_models:
+            num = 0
+
+        start_time = time.time()
+        deadline = start_time + self.timeout
+        key = (self.given_nonogram.width, self.given_nonogram.height, self.threads, self.parallel_mode)
+        if key not in self.sessions:
+            args = ["-t", f"{self.threads},{self.parallel_mode}"] if self.threads > 1 else []
+            self.sessions[key] = SolverSession(self.given_nonogram.width, self.given_nonogram.height, args)
+        session = self.sessions[key]
+        self._set_interrupt(session.interrupt)
+
+        # Cells forced by line propagation are passed as assumptions, which need no grounding
+        assumptions = []
+        if self.use_propagation:
+            prop = propagate(self.given_nonogram)
+            if prop.consistent:
+                for value in (BLACK, WHITE):
+                    for r, c in np.argwhere(prop.grid == value):
+                        assumptions.append((Function("fill", [Number(int(r)+1), Number(int(c)+1)]), value == BLACK))
+        propagation_time = time.time()
+
+        ground_start_cpu = time.process_time()
+        session.set_nonogram(self.given_nonogram)
+        self.decoder = session.get_decoder() if all_models else None
+        ground_time = time.time()
+        self.ground_cpu_time = time.process_time() - ground_start_cpu
+
+        self.solutions.clear()
+        self.curr_soln_idx = -1
+        # Grounding the changed hints happens in this process and cannot be interrupted
+        self.limit_phase = "grounding" if ground_time >= deadline else ""
+        if not self.limit_phase:
+            solve_start_cpu = time.process_time()
+            with session.solve(num, self._on_model, assumptions) as handle:
+                if self.cancelled:
+                    # The cancel came before the search started, its interrupt may have been cleared with the pending ones
+                    handle.cancel()
+                elif not self._wait(handle, deadline):
+                    handle.cancel()
+                    self.limit_phase = "solving"
+                interrupted = handle.get().interrupted
+            self.solve_cpu_time = time.process_time() - solve_start_cpu
+            self.statistics = clingo_statistics(session.ctl.statistics)
+            if interrupted and not self.limit_phase:
+                # Stopped by a cancel (or a stray interrupt): the models found are never a conclusive result
+                self.limit_phase = "solving"
+        self._interrupt = None
+        if self.cancelled:
+            self.limit_phase = ""
         end_time = time.time()
 
         if self.solutions:
             self.curr_soln_idx = 0
+        self.found_all = all_models
+
+        self.propagation_time = propagation_time - start_time
+        self.ground_time = ground_time - propagation_time
+        self.solve_time = end_time - ground_time
+        self.timed_out = bool(self.limit_phase) or self.cancelled
+
+        return self._report(MULTISHOT_SOLVER, end_time - start_time, check_unique, all_models)
 
+    def _run_native_solver(self, check_unique: bool, all_models: bool) -> SolverResult:
+        """Solve the given nonogram with the native bitset line solver instead of clingo"""
+        num = 1
+        if check_unique:
+            num = 2
         if all_models:
-            self.found_all = True
-        else:
-            self.found_all = False
+            num = 0
+
+        start_time = time.time()
+        solver = NativeSolver(self.given_nonogram, self.timeout)
+        self._set_interrupt(solver.cancel)
+        self.solutions.clear()
+        self.curr_soln_idx = -1
+        setup_time = time.time()
+
+        def on_grid(grid: np.ndarray) -> None:
+            # Streamed into the (memory-capped) store as soon as the search finds it
+            soln = NonogramSoln(self.given_nonogram)
+            soln.grid[:, :] = grid
+            self._store_solution(soln)
+        solver.solve(num, on_grid)
+        self._interrupt = None
+        end_time = time.time()
 
-        # Status bar output
-        form_time = format_time(end_time - start_time)
+        self.curr_soln_idx = 0 if self.solutions else -1
+        self.found_all = all_models
+
+        self.propagation_time = 0.0
+        self.ground_time = setup_time - start_time
+        self.solve_time = end_time - setup_time
+        self.timed_out = solver.timed_out
+        self.limit_phase = "solving" if solver.timed_out and not self.cancelled else ""
+
+        return self._report(NATIVE_SOLVER, end_time - start_time, check_unique, all_models)
+
+    def _load_cached(self, check_unique: bool, all_models: bool) -> bool:
+        """Take the solutions from the cache if it holds a verdict that answers this run; return whether it did"""
+        start_time = time.time()
+        entry = self.cache.lookup(self.given_nonogram)
+        if entry is None or not answers(entry, check_unique, all_models):
+            return False
+
+        num = 0 if all_models else (2 if check_unique else 1)
+        self.solutions.clear()
+        self.curr_soln_idx = -1
+        for packed in entry.solutions[:num or None]:
+            if self.solutions.append_packed(packed) and self.on_solution:
+                self.on_solution(self.solutions[-1])
+        if self.solutions:
+            self.curr_soln_idx = 0
+
+        self.propagation_time, self.ground_time = 0.0, 0.0
+        self.solve_time = time.time() - start_time
+        self.timed_out = False
+        self.limit_phase = ""
+        self.found_all = all_models
+        self._report(f"cache/{entry.solver}", self.solve_time, check_unique, all_models)
+        return True
+
+    def _save_to_cache(self, result: SolverResult, check_unique: bool, all_models: bool) -> None:
+        """Record the outcome of a finished run in the cache (runs that timed out or were cancelled are not conclusive)"""
+        if self.cache and not self.timed_out and not self.cancelled and result.solver:
+            self.cache.store_solutions(self.given_nonogram, self.solutions, check_unique, all_models, result.solver,
+                                       result.propagation_time + result.ground_time + result.solve_time)
+
+    def _reset_statistics(self) -> None:
+        self.statistics = {}
+        self.ground_cpu_time = 0.0
+        self.solve_cpu_time = 0.0
+        self.model_cpu_time = 0.0
+
+    def _report(self, solver_path: str, total_time: float, check_unique: bool, all_models: bool) -> SolverResult:
+        """Build the status bar output and the statistics of the last solver run"""
+        form_time = format_time(total_time)
         self.res = ""
 
         if not self.solutions:
@@ -145,26 +804,29 @@ class SolutionHandler:
             if len(self.solutions) == 1:
                 self.res = f"Solver '{solver_path}' took {form_time} to find a unique solution"
             else:
-                self.res = f"Solver '{solver_path}' took {form_time} to find {"all" if not timed_out else ""} {len(self.solutions)} solutions"
-
-        if timed_out:
-            self.res += " (timeout)"
-
-        print(self.res + ":")
-        print(f"\tGrounding:  {format_time(ground_time - start_time)}")
-        print(f"\tSolving:    {format_time(end_time - ground_time)}")
-        # if check_unique:
-        #     print(f"\tUniqueness: {format_time(unique_time - end_time)}")
-        # if all_models and len(self.solutions) > 1:
-        #     print(f"\tAll Solutions: {format_time(all_time - unique_time)}")
-        
-        return self.res
+                self.res = f"Solver '{solver_path}' took {form_time} to find {"all" if not self.timed_out else ""} {len(self.solutions)} solutions"
+
+        if self.cancelled:
+            self.res += " (cancelled)"
+        elif self.timed_out:
+            self.res += f" (timeout while {self.limit_phase})" if self.limit_phase else " (timeout)"
+
+        self.result = SolverResult(solver_path, self.res, len(self.solutions), self.timed_out, self.limit_phase,
+                                   self.propagation_time, self.ground_time, self.solve_time,
+                                   ground_cpu_time=self.ground_cpu_time, solve_cpu_time=self.solve_cpu_time,
+                                   model_cpu_time=self.model_cpu_time, **self.statistics)
+        return self.result
     
     def _on_model(self, model: Model) -> None:
         """Clingo 'model found' callback to convert the model into a NonogramSoln and store it"""
         soln = NonogramSoln(self.given_nonogram)
-        soln.fill_from_model(model)
-        self.solutions.append(soln)
+        soln.fill_from_model(model, self.decoder)
+        self._store_solution(soln)
+
+    def _store_solution(self, soln: NonogramSoln) -> None:
+        """Store a new solution and pass it on to the on_solution callback (unless it is a duplicate)"""
+        if self.solutions.append(soln) and self.on_solution:
+            self.on_solution(soln)
 
     def solves_row(self, row: int) -> bool:
         """Does the current working solution match the hints in the specified row in the given nonogram?"""
@@ -0,0 +1,318 @@
+# Native nonogram solver without clingo: bitset line solver with probing and backtracking
+# Author: Fabian Kraus
+#
+# Every line is represented by two integer bitmasks (known black / known white cells, bit i = cell i).
+# The line solver is an exact dynamic program over the blocks of the hint: for every block, the sets
+# of feasible start and end positions are computed with shifts and masks on the whole line at once.
+# A cell is forced if it has the same color in every arrangement of the line. Lines are solved until
+# a fixpoint is reached; undecided cells are then probed and, if that is not enough, branched on.
+
+import time
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from .common import Nonogram, LineHint
+from .propagation import UNKNOWN, WHITE, BLACK
+
+
+def _full(n: int) -> int:
+    return (1 << n) - 1
+
+
+def _fill_forward(seeds: int, through: int, n: int) -> int:
+    """Positions p in 0..n reachable from a seed e <= p, moving from q to q+1 only if bit q of 'through' is set"""
+    gen = seeds
+    pro = (through << 1) & _full(n + 1)
+    shift = 1
+    while shift <= n:
+        gen |= pro & (gen << shift)
+        pro &= pro << shift
+        shift <<= 1
+    return gen & _full(n + 1)
+
+
+def _any_in_window(mask: int, length: int) -> int:
+    """Bit s is set if any bit of mask is set in s..s+length-1"""
+    res = mask
+    covered = 1
+    while covered < length:
+        step = min(covered, length - covered)
+        res |= res >> step
+        covered += step
+    return res
+
+
+def _smear_forward(mask: int, length: int) -> int:
+    """Bit c is set if any bit of mask is set in c-length+1..c (i.e. blocks of the given length starting at the set bits)"""
+    res = mask
+    covered = 1
+    while covered < length:
+        step = min(covered, length - covered)
+        res |= res << step
+        covered += step
+    return res
+
+
+def _reverse(mask: int, n: int) -> int:
+    return int(format(mask, f"0{n}b")[::-1], 2) if n else 0
+
+
+def _prefix_states(black: int, white: int, blocks: List[int], n: int) -> Tuple[List[int], List[int]]:
+    """Forward pass: prefix[j] holds the positions p such that cells 0..p-1 can hold exactly the first j blocks,
+    starts[j] the feasible start positions of block j given the blocks before it"""
+    not_black = _full(n) & ~black
+    prefix = [_fill_forward(1, not_black, n)]
+    starts = []
+    for j, length in enumerate(blocks):
+        # Block j starts right at the line start (first block only) or after a cell that can be white
+        ready = prefix[j] if j == 0 else ((prefix[j] & not_black) << 1)
+        s = ready & ~_any_in_window(white, length) & _full(max(n - length + 1, 0))
+        starts.append(s)
+        prefix.append(_fill_forward(s << length, not_black, n))
+    return prefix, starts
+
+
+def _line_states(black: int, white: int, blocks: List[int], n: int) -> Tuple[List[int], List[int], List[int]] | None:
+    """Forward and backward passes over the line: prefix states, forward-feasible block starts and suffix states,
+    or None if the line is contradictory"""
+    prefix, starts = _prefix_states(black, white, blocks, n)
+    if not (prefix[-1] >> n) & 1:
+        return None
+
+    # Backward pass on the reversed line: suffix[j] holds the positions q such that cells q..n-1 can hold blocks j..k-1
+    k = len(blocks)
+    rev_prefix, _ = _prefix_states(_reverse(black, n), _reverse(white, n), blocks[::-1], n)
+    suffix = [_reverse(rev_prefix[k - j], n + 1) for j in range(k + 1)]
+    return prefix, starts, suffix
+
+
+def _valid_starts(starts: List[int], suffix: List[int], black: int, blocks: List[int], n: int) -> List[int]:
+    """Start positions of every block that are part of at least one arrangement of the whole line"""
+    k = len(blocks)
+    valid = []
+    for j, length in enumerate(blocks):
+        # The block is either the last one ending at the line end, or is followed by a white cell and the remaining blocks
+        v = starts[j] & (suffix[j + 1] >> (length + 1)) & ~(black >> length)
+        if j == k - 1 and n - length >= 0:
+            v |= starts[j] & (1 << (n - length))
+        valid.append(v)
+    return valid
+
+
+def feasible_starts_bits(black: int, white: int, blocks: List[int], n: int) -> List[int] | None:
+    """Exact start positions (bitmask per block) of the blocks over all arrangements of the line, or None if the line is contradictory"""
+    states = _line_states(black, white, blocks, n)
+    if states is None:
+        return None
+    _, starts, suffix = states
+    return _valid_starts(starts, suffix, black, blocks, n)
+
+
+def solve_line_bits(black: int, white: int, blocks: List[int], n: int) -> Tuple[int, int] | None:
+    """Exact line solver: return the (black, white) masks of all cells that are forced, or None if the line is contradictory"""
+    states = _line_states(black, white, blocks, n)
+    if states is None:
+        return None
+    prefix, starts, suffix = states
+
+    can_white = 0
+    for j in range(len(blocks) + 1):
+        can_white |= prefix[j] & (suffix[j] >> 1)
+    can_white &= _full(n) & ~black
+
+    can_black = 0
+    for valid, length in zip(_valid_starts(starts, suffix, black, blocks, n), blocks):
+        can_black |= _smear_forward(valid, length)
+    can_black &= _full(n)
+
+    return can_black & ~can_white, can_white & ~can_black
+
+
+def _to_bits(line: np.ndarray, value: int) -> int:
+    return int.from_bytes(np.packbits(line == value, bitorder='little').tobytes(), 'little')
+
+
+def _from_bits(mask: int, n: int) -> np.ndarray:
+    raw = np.frombuffer(mask.to_bytes((n + 7) // 8 or 1, 'little'), dtype=np.uint8)
+    return np.unpackbits(raw, bitorder='little')[:n].astype(bool)
+
+
+class NativeSolver:
+    def __init__(self, nonogram: Nonogram, timeout: float = float('inf')):
+        """Init a solver for the given nonogram that gives up after the timeout (in seconds)"""
+        self.width = nonogram.width
+        self.height = nonogram.height
+        self.row_blocks = [self._blocks(hint) for hint in nonogram.row_hints]
+        self.col_blocks = [self._blocks(hint) for hint in nonogram.col_hints]
+        self.timeout = timeout
+        self.timed_out = False
+        self.cancelled = False
+        self._deadline = float('inf')
+
+    def cancel(self) -> None:
+        """Stop the search as soon as possible (can be called from another thread, also before solve)"""
+        self.cancelled = True
+        self._deadline = 0.0
+
+    @staticmethod
+    def _blocks(hint: LineHint) -> List[int]:
+        return [l for l in hint if l > 0]
+
+    def _solve_line(self, grid: np.ndarray, index: int, is_row: bool) -> np.ndarray | None:
+        line = grid[index, :] if is_row else grid[:, index]
+        blocks = self.row_blocks[index] if is_row else self.col_blocks[index]
+        n = len(line)
+        forced = solve_line_bits(_to_bits(line, BLACK), _to_bits(line, WHITE), blocks, n)
+        if forced is None:
+            return None
+        result = line.copy()
+        result[_from_bits(forced[0], n)] = BLACK
+        result[_from_bits(forced[1], n)] = WHITE
+        return result
+
+    def propagate(self, grid: np.ndarray, rows: set | None = None, cols: set | None = None) -> bool:
+        """Solve lines in place until a fixpoint is reached; return False on a contradiction"""
+        dirty_rows = set(range(self.height)) if rows is None else rows
+        dirty_cols = set(range(self.width)) if cols is None else cols
+        while dirty_rows or dirty_cols:
+            for r in sorted(dirty_rows):
+                line = self._solve_line(grid, r, True)
+                if line is None:
+                    return False
+                changed = np.flatnonzero(line != grid[r, :])
+                grid[r, :] = line
+                dirty_cols.update(changed.tolist())
+            dirty_rows = set()
+
+            for c in sorted(dirty_cols):
+                line = self._solve_line(grid, c, False)
+                if line is None:
+                    return False
+                changed = np.flatnonzero(line != grid[:, c])
+                grid[:, c] = line
+                dirty_rows.update(changed.tolist())
+            dirty_cols = set()
+        return True
+
+    def _try(self, grid: np.ndarray, r: int, c: int, value: int) -> np.ndarray | None:
+        trial = grid.copy()
+        trial[r, c] = value
+        return trial if self.propagate(trial, {r}, {c}) else None
+
+    def _frontier(self, grid: np.ndarray) -> np.ndarray:
+        """Undecided cells next to a decided cell (or all undecided cells if there are none)"""
+        unknown = grid == UNKNOWN
+        known = ~unknown
+        near = np.zeros_like(known)
+        near[1:, :] |= known[:-1, :]
+        near[:-1, :] |= known[1:, :]
+        near[:, 1:] |= known[:, :-1]
+        near[:, :-1] |= known[:, 1:]
+        cells = np.argwhere(unknown & near)
+        return cells if cells.size else np.argwhere(unknown)
+
+    def _probe(self, grid: np.ndarray) -> Tuple[bool, List[np.ndarray]]:
+        """Try both colors on the undecided frontier cells and fix cells where one color leads to a contradiction.
+        Return False if the grid is contradictory, otherwise the branches of the most promising cell to split on"""
+        while True:
+            best: List[np.ndarray] = []
+            best_score = -1
+            changed = False
+            for r, c in self._frontier(grid):
+                if grid[r, c] != UNKNOWN:
+                    continue
+                if time.time() > self._deadline:
+                    return True, best
+                as_black = self._try(grid, r, c, BLACK)
+                as_white = self._try(grid, r, c, WHITE)
+                if as_black is None and as_white is None:
+                    return False, []
+                if as_black is None or as_white is None:
+                    # Earlier branches are stale now, the next pass recomputes them
+                    grid[:, :] = as_white if as_black is None else as_black
+                    changed = True
+                    continue
+                if changed:
+                    continue
+
+                # Prefer cells where both colors decide many other cells
+                score = min(np.count_nonzero(as_black != UNKNOWN), np.count_nonzero(as_white != UNKNOWN))
+                if score > best_score:
+                    best, best_score = [as_white, as_black], score
+            if not changed:
+                return True, best
+
+    def solve(self, max_models: int = 2, on_solution: Callable[[np.ndarray], None] | None = None) -> List[np.ndarray]:
+        """Find up to max_models solutions (0: all); every solution is a boolean grid with True for black cells.
+        With on_solution, every solution is passed to it as soon as it is found instead of being collected in the returned list"""
+        self.timed_out = False
+        self._deadline = 0.0 if self.cancelled else time.time() + self.timeout
+        solutions: List[np.ndarray] = []
+        found = 0
+
+        grid = np.full((self.height, self.width), UNKNOWN, dtype=np.int8)
+        if not self.propagate(grid):
+            return solutions
+
+        # Depth-first search, probing at every node and branching on the most promising cell
+        stack = [grid]
+        while stack:
+            if time.time() > self._deadline:
+                self.timed_out = True
+                break
+            grid = stack.pop()
+            if not np.any(grid == UNKNOWN):
+                found += 1
+                if on_solution:
+                    on_solution(grid == BLACK)
+                else:
+                    solutions.append(grid == BLACK)
+                if max_models and found >= max_models:
+                    break
+                continue
+
+            consistent, branches = self._probe(grid)
+            if not consistent:
+                continue
+            if not np.any(grid == UNKNOWN):
+                stack.append(grid)
+                continue
+            if not branches:
+                # Probing ran into the deadline
+                self.timed_out = True
+                break
+            stack.extend(branches)
+        return solutions
+
+
+def allowed_start_facts(nonogram: Nonogram, grid: np.ndarray | None = None) -> str:
+    """ASP facts allowed_start_r(R,I,S) and allowed_start_c(C,I,S) with the exact feasible starts of every block,
+    given the known cells of the grid (default: none). Blocks of a contradictory line get no allowed starts"""
+    if grid is None:
+        grid = np.full((nonogram.height, nonogram.width), UNKNOWN, dtype=np.int8)
+    else:
+        grid = grid.copy()
+
+    # Lines without blocks are white, which also rules out blocks crossing them
+    for r, hint in enumerate(nonogram.row_hints):
+        if not NativeSolver._blocks(hint):
+            grid[r, grid[r, :] == UNKNOWN] = WHITE
+    for c, hint in enumerate(nonogram.col_hints):
+        if not NativeSolver._blocks(hint):
+            grid[grid[:, c] == UNKNOWN, c] = WHITE
+
+    facts = ["#defined allowed_start_r/3.", "#defined allowed_start_c/3."]
+    for kind, hints, lines in (("r", nonogram.row_hints, grid), ("c", nonogram.col_hints, grid.T)):
+        for index, (hint, line) in enumerate(zip(hints, lines), start=1):
+            # Facts use the hint index of the original hint, which may contain zeros
+            indices = [i for i, l in enumerate(hint, start=1) if l > 0]
+            starts = feasible_starts_bits(_to_bits(line, BLACK), _to_bits(line, WHITE), NativeSolver._blocks(hint), len(line))
+            if starts is None:
+                continue
+            for i, mask in zip(indices, starts):
+                while mask:
+                    low = mask & -mask
+                    facts.append(f"allowed_start_{kind}({index},{i},{low.bit_length()}).")
+                    mask ^= low
+    return "\n".join(facts)
@@ -10,17 +10,25 @@ from PyQt5.QtCore import Qt
 
 from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
 
+from matplotlib.collections import LineCollection
 from matplotlib.figure import Figure
-import matplotlib.pyplot as plt
 import numpy as np
+from collections import OrderedDict
+from typing import Tuple
 
 import cv2
 
-from .common import Nonogram
+from .common import Nonogram, canonical_hash, correlated_noise
 from .handlers.solution_handler import SolutionHandler
+from .solution_cache import SolutionCache
 
 WINDOW_WIDTH = 1000
 WINDOW_HEIGHT = 700
+UNIQUENESS_CACHE_SIZE = 64 # number of uniqueness check results kept in memory
+
+# Results of the uniqueness checks of this session, by hint hash, least recently used first:
+# (unique, pixels that are black in every solution if not unique)
+_checked_hints: 'OrderedDict[str, Tuple[bool, np.ndarray | None]]' = OrderedDict()
 
 class NonogramCreator(QDialog):
     
@@ -35,6 +43,7 @@ class NonogramCreator(QDialog):
         # Setup default nonogram creation parameters
         self.bwratio: float = 0.6
         self.pxcorr: float = 0.8
+        self.seed: int = 0 # seed of the random noise, 0: new noise on every reload
         self.threshold: int = 100
         self.im_file_path: str = ""
         self.success: bool = True
@@ -154,6 +163,18 @@ class NonogramCreator(QDialog):
                 pxcorr_layout.addWidget(self.pxcorr_sb)
                 left_layout.addWidget(pxcorr_frame)
 
+                seed_frame = QFrame()
+                seed_layout = QHBoxLayout(seed_frame)
+                seed_label = QLabel("Seed (0: random):")
+                self.seed_sb = QSpinBox()
+                self.seed_sb.setRange(0, 2**31 - 1)
+                self.seed_sb.setValue(self.seed)
+                self.seed_sb.setEnabled(False)
+                self.seed_sb.valueChanged.connect(self._on_set_seed)
+                seed_layout.addWidget(seed_label)
+                seed_layout.addWidget(self.seed_sb)
+                left_layout.addWidget(seed_frame)
+
             if value == "image":
                 # Add file selection button
                 file_select_frame = QFrame()
@@ -256,8 +277,18 @@ class NonogramCreator(QDialog):
         self.figure.tight_layout()
         self.axes.set_xticks([])
         self.axes.set_yticks([])
-        self.axes.imshow(self.grid, 'gray', vmin=0, vmax=255)
+
+        # The preview artists are created once and updated in place by update_plot:
+        # the loaded image (stretched to the grid), the grid lines and the grid itself
+        self.background_image = self.axes.imshow(np.zeros((1, 1), dtype=np.uint8), cmap='gray', vmin=0, vmax=255,
+                                                 aspect='auto', zorder=1, visible=False)
+        self.grid_lines = LineCollection([], colors='gray', linewidths=0.5, zorder=1.5, visible=False)
+        self.grid_lines_shape: Tuple[int, int] = (0, 0) # grid size the line segments were built for
+        self.axes.add_collection(self.grid_lines)
+        self.preview_image = self.axes.imshow(self._convert_to_rgba(self.grid, False), zorder=2)
+        self.axes.set_aspect('equal')
         self.canvas = FigureCanvasQTAgg(self.figure)
+        self.update_plot()
         right_layout.addWidget(self.canvas)
 
         # Connect signals for key handling
@@ -271,27 +302,8 @@ class NonogramCreator(QDialog):
             self.grid = np.full((self.height_, self.width_), 255, dtype=np.uint8)
         
         elif opt_str == "random":
-            # generate random boolean matrix
-            self.grid = np.random.choice([0, 255], size=(self.height_, self.width_), p=[1 - self.bwratio, self.bwratio]).astype(np.uint8)
-
-            # correlate neighboring values in matrix
-            for i in range(self.height_):
-                for j in range(self.width_):
-                    if np.random.rand() < self.pxcorr:
-                        # Check neighboring cells
-                        neighbors = []
-                        if i > 0:
-                            neighbors.append(self.grid[i-1, j])
-                        if j > 0:
-                            neighbors.append(self.grid[i, j-1])
-                        if i < self.height_ - 1:
-                            neighbors.append(self.grid[i+1, j])
-                        if j < self.width_ - 1:
-                            neighbors.append(self.grid[i, j+1])
-
-                        # If there are any neighbors, set the current cell to the majority value
-                        if neighbors:
-                            self.grid[i, j] = max(set(neighbors), key=neighbors.count)
+            # generate random image with correlated neighboring pixels
+            self.grid = correlated_noise(self.height_, self.width_, self.bwratio, self.pxcorr, self.seed or None)
 
         elif opt_str == "image" and hasattr(self, 'im_original'):
             # Resize the image to a lower resolution
@@ -307,32 +319,36 @@ class NonogramCreator(QDialog):
 
     def update_plot(self):
         """Re-draw the preview image"""
-        self.axes.clear()
-        
-        grid_width = self.grid.shape[1]
-        grid_height = self.grid.shape[0]
+        grid_height, grid_width = self.grid.shape
         extent = (0.0, grid_width, grid_height, 0.0)
-
-        # Draw background if available
-        if self.selected_option_var == "image" and hasattr(self, 'im_original'):
-            #Stretch background to match grid aspect ratio
-            self.axes.imshow(self.im_original, cmap='gray', vmin=0, vmax=255,
-                            aspect='auto', extent=extent, zorder=1)
-            for i in range(self.grid.shape[0] + 1):
-                self.axes.axhline(i, color='gray', linewidth=0.5)
-            for j in range(self.grid.shape[1] + 1):
-                self.axes.axvline(j, color='gray', linewidth=0.5)
-            
-        rgba_image = self._convert_to_rgba(self.grid,  self.selected_option_var == "image" and hasattr(self, 'im_original'))
-        # Display the RGBA image
-        self.axes.imshow(rgba_image, aspect='equal', zorder=2, extent=extent)
-        self.axes.set_xlim(0, self.grid.shape[1])
-        self.axes.set_ylim(self.grid.shape[0], 0)
-        self.axes.set_aspect('equal')
-        self.axes.set_xticks([])
-        self.axes.set_yticks([])
-        plt.tight_layout()
-        self.canvas.draw()
+        show_background = self.selected_option_var == "image" and hasattr(self, 'im_original')
+
+        # Draw background if available, stretched to match grid aspect ratio
+        if show_background:
+            self.background_image.set_data(self.im_original)
+            self.background_image.set_extent(extent)
+            if self.grid_lines_shape != self.grid.shape:
+                self.grid_lines.set_segments(self._grid_segments(grid_height, grid_width))
+                self.grid_lines_shape = self.grid.shape
+        self.background_image.set_visible(show_background)
+        self.grid_lines.set_visible(show_background)
+
+        self.preview_image.set_data(self._convert_to_rgba(self.grid, show_background))
+        self.preview_image.set_extent(extent)
+        self.axes.set_xlim(0, grid_width)
+        self.axes.set_ylim(grid_height, 0)
+        self.canvas.draw_idle()
+
+    @staticmethod
+    def _grid_segments(height: int, width: int) -> np.ndarray:
+        """Line segments of all row and column borders of a grid"""
+        rows = np.arange(height + 1, dtype=float)
+        cols = np.arange(width + 1, dtype=float)
+        horizontal = np.stack([np.stack([np.zeros_like(rows), rows], axis=1),
+                               np.stack([np.full_like(rows, width), rows], axis=1)], axis=1)
+        vertical = np.stack([np.stack([cols, np.zeros_like(cols)], axis=1),
+                             np.stack([cols, np.full_like(cols, height)], axis=1)], axis=1)
+        return np.concatenate([horizontal, vertical])
 
     def _convert_to_rgba(self, grid, bg):
         """Convert a binary grid to RGBA format where white pixels are transparent"""
@@ -361,23 +377,30 @@ class NonogramCreator(QDialog):
     
     def _check_uniqueness(self):
         """Run the nonogram solver and see if it would be unique"""
-        # Convert grid to nonogram, then solve it to check uniqueness
+        # Convert grid to nonogram; images with the same hints were checked before if they are in the LRU cache
         nonogram = Nonogram()
         nonogram.init_from_grid(self.grid != 255)
-        soln_handler = SolutionHandler()
-        soln_handler.give_nonogram(nonogram)
-        soln_handler.set_timeout(self.timeout)
-        _ = soln_handler.run_solver_auto(True, True)
-        if not soln_handler.solutions:
+        key = canonical_hash(nonogram)
+        if key in _checked_hints:
+            _checked_hints.move_to_end(key)
+            unique, cautious_pixels = _checked_hints[key]
+        else:
+            unique, cautious_pixels = self._solve_uniqueness(nonogram)
+            if unique is not None:
+                _checked_hints[key] = (unique, cautious_pixels)
+                if len(_checked_hints) > UNIQUENESS_CACHE_SIZE:
+                    _checked_hints.popitem(last=False)
+
+        if unique is None:
             self.uniqueness_label.setText("   Uniqueness check timed out")
             self.uniqueness_label.setStyleSheet("color: default; font-size: 11px;")
             self.cautious_pixels = None
             self.unique = False
             self.make_unique_button.setDisabled(True)        
-        elif len(soln_handler.solutions) > 1:
-            self.uniqueness_label.setText(f"   ✗ Nonogram is not unique! ({len(soln_handler.solutions)} Solutions)")
+        elif not unique:
+            self.uniqueness_label.setText(f"   ✗ Nonogram is not unique! ({np.count_nonzero((self.grid == 0) & ~cautious_pixels)} undetermined pixels)")
             self.uniqueness_label.setStyleSheet("color: red; font-size: 11px;")
-            self.cautious_pixels = soln_handler.get_cautious_pixels()
+            self.cautious_pixels = cautious_pixels
             self.unique = False
             self.make_unique_button.setDisabled(False)
         else:
@@ -389,6 +412,19 @@ class NonogramCreator(QDialog):
 
         self.update_plot()
 
+    def _solve_uniqueness(self, nonogram: Nonogram) -> Tuple[bool | None, np.ndarray | None]:
+        """Solve the nonogram: whether it is unique (None if the check timed out) and, if it is not, the pixels that are black in every solution"""
+        soln_handler = SolutionHandler()
+        soln_handler.cache = SolutionCache()
+        soln_handler.give_nonogram(nonogram)
+        soln_handler.set_timeout(self.timeout)
+        # Two models are enough to decide uniqueness; the undetermined pixels come from clingo's consequences
+        _ = soln_handler.run_solver_auto(True, False)
+        cautious_pixels = soln_handler.get_cautious_pixels() if len(soln_handler.solutions) > 1 else None
+        if not soln_handler.solutions or (len(soln_handler.solutions) > 1 and cautious_pixels is None):
+            return None, None
+        return len(soln_handler.solutions) == 1, cautious_pixels
+
     def _on_make_unique(self):
         if self.cautious_pixels is None or self.unique:
             return
@@ -448,16 +484,19 @@ class NonogramCreator(QDialog):
             if value == "random":
                 self.bwratio_sb.setEnabled(True)
                 self.pxcorr_sb.setEnabled(True)
+                self.seed_sb.setEnabled(True)
                 self.file_select_bt.setEnabled(False)
                 self.threshold_sb.setEnabled(False)
             elif value == "image":
                 self.bwratio_sb.setEnabled(False)
                 self.pxcorr_sb.setEnabled(False)
+                self.seed_sb.setEnabled(False)
                 self.file_select_bt.setEnabled(True)
                 self.threshold_sb.setEnabled(True)
             else:  # "empty"
                 self.bwratio_sb.setEnabled(False)
                 self.pxcorr_sb.setEnabled(False)
+                self.seed_sb.setEnabled(False)
                 self.file_select_bt.setEnabled(False)
                 self.threshold_sb.setEnabled(False)
 
@@ -492,6 +531,12 @@ class NonogramCreator(QDialog):
         self.pxcorr = input
         self.reload()
 
+    def _on_set_seed(self, input):
+        if self.seed == input:
+            return
+        self.seed = input
+        self.reload()
+
     def _on_set_threshold(self, input):
         if self.threshold == input:
             return
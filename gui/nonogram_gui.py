@@ -3,32 +3,55 @@
 # run with: python3 -m gui [optional parameter: nonogram filename] [optional parameter: solver name]
 #    e.g. : python3 -m gui nonograms/example_05.lp symbolic-block-start
 
+import os
+import time
 from os import listdir
 from os.path import isfile, join
-from math import ceil
 from typing import List
 
 import numpy as np
 
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QThread, pyqtSignal
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import QKeySequence
 
-from matplotlib.backends.backend_qtagg import FigureCanvasQTAgg
-
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-from matplotlib.patches import Patch
-from matplotlib.text import Text
-
+from .board_widget import BoardWidget
 from .common import *
+from .corpus import Corpus, is_corpus
 from .nonogram_creator import NonogramCreator
 from .handlers.nonogram_handler import NonogramHandler
-from .handlers.solution_handler import SolutionHandler
+from .handlers.solution_handler import SolutionHandler, SolverResult, NATIVE_SOLVER, MULTISHOT_SOLVER
+from .solution_cache import SolutionCache
 
 WINDOW_WIDTH = 800
 WINDOW_HEIGHT = 600
 SQUARE_SIZE = 50 #default side length of a grid cell, in pixels
+STREAM_REDRAW_INTERVAL = 0.25 # minimum time in seconds between redraws of streamed solutions
+
+class SolverThread(QThread):
+    # Emitted for every new solution while the solver runs (from clingo's solving thread)
+    solution_found = pyqtSignal(object)
+
+    def __init__(self, solution_handler: SolutionHandler, name: str, check_unique: bool, all_models: bool) -> None:
+        """Thread that runs the solver identified by its name, so the GUI stays responsive while solving"""
+        super().__init__()
+        self.solution_handler = solution_handler
+        self.name = name
+        self.check_unique = check_unique
+        self.all_models = all_models
+        self.result: SolverResult | None = None
+
+    def run(self) -> None:
+        self.solution_handler.on_solution = self.solution_found.emit
+        try:
+            if self.name == "auto":
+                self.result = self.solution_handler.run_solver_auto(self.check_unique, self.all_models)
+            elif self.name == "portfolio":
+                self.result = self.solution_handler.run_solver_portfolio(self.check_unique, self.all_models)
+            else:
+                self.result = self.solution_handler.run_solver(self.name.split(".")[0], self.check_unique, self.all_models)
+        finally:
+            self.solution_handler.on_solution = None
 
 class NonogramGUI(QMainWindow):
 
@@ -39,6 +62,7 @@ class NonogramGUI(QMainWindow):
         # Setup data handlers
         self.nonogram_handler = NonogramHandler()
         self.solution_handler = SolutionHandler()
+        self.solution_handler.cache = SolutionCache()
 
         # Flags indicating which cell is currently being hovered over
         self.highlighted_x, self.highlighted_y = -1, -1
@@ -54,6 +78,12 @@ class NonogramGUI(QMainWindow):
         # Flag to freeze the currently hovered row/column when opening a dialog box (eg hint editor)
         self.block_hover = False
 
+        # Background solver state
+        self.solver_thread: SolverThread | None = None
+        self.streamed_solns = 0
+        self.last_stream_draw = 0.0
+        self.solving_disabled_actions: List[QAction] = [] # actions that would change the nonogram, solutions or solver settings while solving
+
         # Setup window
         self.setMinimumSize(WINDOW_WIDTH, WINDOW_HEIGHT)
         self.setWindowTitle("Nonogram Viewer, Editor & Solver")
@@ -110,20 +140,66 @@ class NonogramGUI(QMainWindow):
         self.set_status(f"Showing solution nr. {self.solution_handler.curr_soln_idx + 1}.")
 
     def _on_solver(self, name: str, *_) -> None:
-        """Run the solver, identified by its name"""
+        """Start the solver, identified by its name, on a background thread"""
+        if self.solver_thread:
+            return
         self.set_status("Solving nonogram...")
-        self.status_label.update()
-        self.update()
-        res = self.solution_handler.run_solver(name.split(".")[0], 
-                                               self.check_uniqueness_var, 
-                                               self.find_all_solns_var) if name != "auto" else self.solution_handler.run_solver_auto(self.check_uniqueness_var, self.find_all_solns_var)
-        self.set_status(res + ".")
+        self.streamed_solns = 0
+        self.last_stream_draw = 0.0
+        self._set_solving(True)
+
+        self.solver_thread = SolverThread(self.solution_handler, name, self.check_uniqueness_var, self.find_all_solns_var)
+        self.solver_thread.solution_found.connect(self._on_solution_found)
+        self.solver_thread.finished.connect(self._on_solver_finished)
+        # Cleared here rather than in the run, so a cancel right after starting the thread is not lost
+        self.solution_handler.cancelled = False
+        self.solver_thread.start()
+
+    def _on_solution_found(self, soln: NonogramSoln) -> None:
+        """Show a streamed solution while the solver is still running (redraws are rate-limited)"""
+        if not self.solver_thread:
+            return
+        self.streamed_solns += 1
+        now = time.time()
+        if self.streamed_solns == 1 or now - self.last_stream_draw > STREAM_REDRAW_INTERVAL:
+            self._draw_grid(soln.grid)
+            self.last_stream_draw = now
+        self.set_status(f"Solving nonogram... {self.streamed_solns} solution{"s" if self.streamed_solns > 1 else ""} found so far.")
+
+    def _on_solver_finished(self) -> None:
+        assert self.solver_thread
+        result = self.solver_thread.result
+        self.solver_thread = None
+        self._set_solving(False)
+        if result is None:
+            self.set_status("Solver failed.")
+            self.stats_label.setText("")
+        else:
+            self.set_status(result.message + ".")
+            self.stats_label.setText(result.summary() if result.ground_atoms else "")
 
         self._draw_solution()
+
+    def _on_cancel_solver(self, *_) -> None:
+        if self.solver_thread:
+            self.set_status("Cancelling solver...")
+            self.solution_handler.cancel()
+
+    def _set_solving(self, solving: bool) -> None:
+        for action in self.solving_disabled_actions:
+            action.setEnabled(not solving)
+        self.cancel_solver_action.setEnabled(solving)
+
+    def closeEvent(self, event) -> None:
+        # Stop a running solver before the window (and its thread object) goes away
+        if self.solver_thread:
+            self.solution_handler.cancel()
+            self.solver_thread.wait()
+        super().closeEvent(event)
     
     def _on_file_open(self, *_) -> None:
         """Open a file dialog and let the user load a file"""
-        file_types = "Text format (*.txt);;ASP encoding (*.lp)"
+        file_types = "Text format (*.txt);;ASP encoding (*.lp);;Puzzle corpus (*.ngc)"
         init_dir = "nonograms"
 
         # Open file dialog
@@ -137,13 +213,21 @@ class NonogramGUI(QMainWindow):
             return
 
         try:
-            self.nonogram_handler.load_file(file_path)
+            if is_corpus(file_path):
+                # Pick one puzzle of the archive; it is not tied to a file when saving
+                corpus = Corpus(file_path)
+                puzzle_id, ok = QInputDialog.getItem(self, "Select a puzzle", "Puzzle:", corpus.ids, 0, False)
+                if not ok:
+                    return
+                self.nonogram_handler.loaded_nonogram = corpus[puzzle_id]
+                self.nonogram_handler.loaded_nonogram_filename = None
+                file_path = f"{file_path}:{puzzle_id}"
+            else:
+                self.nonogram_handler.load_file(file_path)
         except Warning as w:
             self.set_status(f"Could not open file: {w.args[0]}")
         except:
             self.set_status(f"Unknown error: Could not load nonogram file")
-        self._clear_all()
-
         nonogram = self.nonogram_handler.get_curr_nonogram()
         self._draw_nonogram(nonogram)
         self.solution_handler.give_nonogram(nonogram)
@@ -156,8 +240,7 @@ class NonogramGUI(QMainWindow):
         if grid is None:
             # self.set_status(f"Ready.")
             return
-        
-        self._clear_all()
+
         self.nonogram_handler.loaded_nonogram_filename = None
         self.nonogram_handler.get_curr_nonogram().init_from_grid(grid)
     
@@ -175,13 +258,12 @@ class NonogramGUI(QMainWindow):
         self.nonogram_handler.get_curr_nonogram().init_from_grid(grid)
 
         nonogram = self.nonogram_handler.get_curr_nonogram()
-        self._clear_all()
         self._draw_nonogram(nonogram)
         self.solution_handler.give_nonogram(nonogram)
         self.set_status(f"Created nonogram from previous grid configuration.")
 
     def _on_file_export_image(self, *_) -> None:
-        """Export the current canvas as an image file at a user-picked location"""
+        """Export the current board as an image file at a user-picked location"""
         file_types = "SVG image (*.svg);;PDF Document (*.pdf);;PNG image (*.png)"
         init_dir = ""
 
@@ -194,7 +276,7 @@ class NonogramGUI(QMainWindow):
         if not file_path:
             return
         
-        self.figure.savefig(file_path, bbox_inches='tight')
+        self.board.export(file_path)
         self.set_status(f"Exported image to {file_path.split("/")[-1]}.")
 
     def _on_file_save(self, *_) -> None:
@@ -250,6 +332,7 @@ class NonogramGUI(QMainWindow):
         new_from_current_action.setShortcuts([QKeySequence("Ctrl+Shift+N")])
         new_from_current_action.triggered.connect(self._on_file_new_from_current)
         file_menu.addAction(new_from_current_action)
+        self.solving_disabled_actions += [open_action, new_action, new_from_current_action]
 
         # Save action
         save_action = QAction("&Save", self)
@@ -294,6 +377,32 @@ class NonogramGUI(QMainWindow):
         self.find_all_solns_action.triggered.connect(self._on_toggle_find_all)
         solver_menu.addAction(self.find_all_solns_action)
 
+        # Line propagation action
+        self.use_propagation_action = QAction("Use line &propagation", self)
+        self.use_propagation_action.setCheckable(True)
+        self.use_propagation_action.setChecked(self.solution_handler.use_propagation)
+        self.use_propagation_action.triggered.connect(self._on_toggle_use_propagation)
+        solver_menu.addAction(self.use_propagation_action)
+
+        # Decomposition action
+        self.use_decomposition_action = QAction("Solve independent parts &separately", self)
+        self.use_decomposition_action.setCheckable(True)
+        self.use_decomposition_action.setChecked(self.solution_handler.use_decomposition)
+        self.use_decomposition_action.triggered.connect(self._on_toggle_use_decomposition)
+        solver_menu.addAction(self.use_decomposition_action)
+
+        # Solution cache actions
+        self.use_cache_action = QAction("Use solution &cache", self)
+        self.use_cache_action.setCheckable(True)
+        self.use_cache_action.setChecked(self.solution_handler.cache is not None)
+        self.use_cache_action.triggered.connect(self._on_toggle_use_cache)
+        solver_menu.addAction(self.use_cache_action)
+        clear_cache_action = QAction("C&lear solution cache", self)
+        clear_cache_action.triggered.connect(self._on_clear_cache)
+        solver_menu.addAction(clear_cache_action)
+        # The solver thread reads these settings while it runs
+        self.solving_disabled_actions += [self.use_propagation_action, self.use_decomposition_action, self.use_cache_action]
+
         # Timeout menu
         self.timeout_var = 1.0
         self.timeout_menu = solver_menu.addMenu("&Timout")
@@ -329,6 +438,36 @@ class NonogramGUI(QMainWindow):
         # Update the actions to reflect the current timeout
         self.update_timeout_actions()
 
+        # Solver threads menu
+        self.threads_menu = solver_menu.addMenu("T&hreads")
+        assert(self.threads_menu)
+        threads_options = [1, 2, 4, 8, 16]
+        if (os.cpu_count() or 1) not in threads_options:
+            threads_options.append(os.cpu_count() or 1)
+        threads_action_group = QActionGroup(self)
+        threads_action_group.setExclusive(True)
+        for n in sorted(threads_options):
+            action = QAction(f"{n}", self, checkable=True)
+            action.setData(n)
+            action.setChecked(n == 1)
+            action.triggered.connect(self._on_threads_selected)
+            self.threads_menu.addAction(action)
+            threads_action_group.addAction(action)
+
+        # Parallel mode menu (only used with more than one thread)
+        self.parallel_mode_menu = solver_menu.addMenu("&Parallel mode")
+        assert(self.parallel_mode_menu)
+        parallel_mode_action_group = QActionGroup(self)
+        parallel_mode_action_group.setExclusive(True)
+        for mode in ["compete", "split"]:
+            action = QAction(mode, self, checkable=True)
+            action.setData(mode)
+            action.setChecked(mode == self.solution_handler.parallel_mode)
+            action.triggered.connect(self._on_parallel_mode_selected)
+            self.parallel_mode_menu.addAction(action)
+            parallel_mode_action_group.addAction(action)
+        self.solving_disabled_actions += [menu.menuAction() for menu in (self.timeout_menu, self.threads_menu, self.parallel_mode_menu)]
+
         solver_menu.addSeparator()
 
         # Add solver actions
@@ -336,13 +475,30 @@ class NonogramGUI(QMainWindow):
         action.setShortcut(QKeySequence("Ctrl+A"))
         action.triggered.connect(lambda _: self._on_solver("auto"))
         solver_menu.addAction(action)
+        self.solving_disabled_actions.append(action)
 
-        solvers = [f for f in listdir("solvers/") if isfile(join("solvers/", f)) and f.endswith(".lp")]
+        action = QAction("&Race all Solvers (Portfolio)", self)
+        action.setShortcut(QKeySequence("Ctrl+P"))
+        action.triggered.connect(lambda _: self._on_solver("portfolio"))
+        solver_menu.addAction(action)
+        self.solving_disabled_actions.append(action)
+
+        solvers = [f for f in listdir("solvers/") if isfile(join("solvers/", f)) and f.endswith(".lp")] + [MULTISHOT_SOLVER, NATIVE_SOLVER]
         for i, solver in enumerate(solvers):
             action = QAction(solver.split(".")[0], self)
             action.setShortcut(QKeySequence(f"Ctrl+{i+1}"))
             action.triggered.connect(lambda _, s=solver: self._on_solver(s))
             solver_menu.addAction(action)
+            self.solving_disabled_actions.append(action)
+
+        solver_menu.addSeparator()
+
+        # Cancel action, only enabled while a solver is running
+        self.cancel_solver_action = QAction("&Cancel Solver", self)
+        self.cancel_solver_action.setShortcut(QKeySequence("Esc"))
+        self.cancel_solver_action.setEnabled(False)
+        self.cancel_solver_action.triggered.connect(self._on_cancel_solver)
+        solver_menu.addAction(self.cancel_solver_action)
 
         # View menu
         view_menu = menubar.addMenu("&View")
@@ -371,42 +527,30 @@ class NonogramGUI(QMainWindow):
         next_soln_action.setShortcuts([QKeySequence("Ctrl+J")])
         next_soln_action.triggered.connect(self._on_next_soln)
         view_menu.addAction(next_soln_action)
+        self.solving_disabled_actions.append(next_soln_action)
 
         # View previous solution action
         prev_soln_action = QAction("View Prev. Solution", self)
         prev_soln_action.setShortcuts([QKeySequence("Ctrl+H")])
         prev_soln_action.triggered.connect(self._on_prev_soln)
         view_menu.addAction(prev_soln_action)
+        self.solving_disabled_actions.append(prev_soln_action)
 
     def _setup_canvas(self):
-
-        # Setup canvas artist storage
-        self.pixels: List[List[Patch]] = []
-        self.crosses: List[List[Text]] = []
-        self.col_hints: List[List[Text]] = []
-        self.row_hints: List[List[Text]] = []
-
         # Create a central widget and layout
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
         layout = QVBoxLayout(central_widget)
 
-        # Create Matplotlib figure and canvas
-        self.figure, self.axes = plt.subplots()
-        plt.subplots_adjust(left=0.0, right=1.0, top=1.0, bottom=0.0)
-        plt.tight_layout()
-        self.axes.set_aspect('equal')
-
-        # Create the canvas for PyQt
-        self.canvas = FigureCanvasQTAgg(self.figure)
+        # The board paints the grid, the cross marks and the hints
+        self.board = BoardWidget()
+        layout.addWidget(self.board, stretch=1)
 
-        # Add canvas to the layout
-        layout.addWidget(self.canvas, stretch=1)
-
-        # Setup button event callbacks (typecast to make pylance happy)
-        self.canvas.mpl_connect('button_press_event', self._on_button_press)
-        self.canvas.mpl_connect('button_release_event', self._on_button_release)
-        self.canvas.mpl_connect('motion_notify_event', self._on_mouse_motion)
+        # Setup mouse event callbacks
+        self.board.cell_pressed.connect(self._on_button_press)
+        self.board.mouse_released.connect(self._on_button_release)
+        self.board.cell_hovered.connect(self._on_mouse_motion)
+        self.board.board_left.connect(self._on_mouse_leave)
 
     def _setup_statusbar(self):
         # Setup status bar directly
@@ -415,6 +559,9 @@ class NonogramGUI(QMainWindow):
         sb.setFixedHeight(20)
         self.status_label = QLabel()
         sb.addWidget(self.status_label, stretch=1)
+        # Ground program size and search effort of the last solver run
+        self.stats_label = QLabel()
+        sb.addPermanentWidget(self.stats_label)
         sb.setStyleSheet("QStatusBar { font-size: 10pt; }")
         self.set_status("Initializing...")
 
@@ -422,38 +569,34 @@ class NonogramGUI(QMainWindow):
         """Set the status bar text"""
         self.status_label.setText(text)
 
-    def _on_button_press(self, event):
-        if event.inaxes != self.axes:
+    def _on_button_press(self, y: int, x: int, button) -> None:
+        if self.solver_thread:
             return
 
         self.solution_handler.use_working_soln()
         nonogram = self.nonogram_handler.get_curr_nonogram()
 
-        # Convert y-coordinate properly for your nonogram grid
-        y = ceil(nonogram.height - event.ydata - 1)
-        x = ceil(event.xdata - 1)
-
         # Check if coordinates are within bounds
         if 0 <= y < nonogram.height and 0 <= x < nonogram.width:
             self.dragging = True
             self.drag_start = self.drag_end = (y, x)
             self.drag_covered = [self.drag_start]
 
-            if event.button == 1:  # Left mouse button
+            if button == Qt.LeftButton:
                 self._on_leftclick_cell(y, x)
                 self.drag_to_cross = False
                 self.drag_to_erase = self.solution_handler.get_curr_soln().grid[y][x]
-            elif event.button == 3:  # Right mouse button
+            elif button == Qt.RightButton:
                 self._on_rightclick_cell(y, x)
                 self.drag_to_cross = True
-                self.drag_to_erase = self.crosses[y][x].get_visible()
-        elif y >= 0 and x < 0 and event.button == 1:
+                self.drag_to_erase = self.board.crosses[y, x]
+        elif 0 <= y < nonogram.height and x < 0 and button == Qt.LeftButton:
             self._on_leftclick_rowhint(y)
-        elif x >= 0 and y < 0 and event.button == 1:
+        elif 0 <= x < nonogram.width and y < 0 and button == Qt.LeftButton:
             self._on_leftclick_colhint(x)
         # remaining case: x, y == -1, -1
 
-    def _on_button_release(self, event):
+    def _on_button_release(self) -> None:
         if self.dragging:
             self.dragging = False
             self.drag_start = self.drag_end = (-1, -1)
@@ -461,22 +604,16 @@ class NonogramGUI(QMainWindow):
             self.drag_to_erase = False
             self.drag_to_cross = False
 
-    def _on_mouse_motion(self, event):
-        if self.block_hover:
-            return
-
-        if event.inaxes != self.axes or not event.ydata or not event.xdata:
+    def _on_mouse_leave(self) -> None:
+        if not self.block_hover:
             self._highlight_hint(-1, -1)
+
+    def _on_mouse_motion(self, y: int, x: int) -> None:
+        if self.block_hover:
             return
 
         nonogram = self.nonogram_handler.get_curr_nonogram()
 
-        x = ceil(event.xdata - 1)
-        y = ceil(nonogram.height - event.ydata - 1)
-
-        if not (0 <= x < nonogram.width and 0 <= y < nonogram.height):
-            return
-
         if self.show_hint_highlight_var and (self.highlighted_x != x or self.highlighted_y != y):
             self._highlight_hint(x, y)
 
@@ -515,7 +652,7 @@ class NonogramGUI(QMainWindow):
             for point in points:
                 y, x = point
                 if 0 <= y < nonogram.height and 0 <= x < nonogram.width:
-                    if self.drag_to_cross and self.crosses[y][x].get_visible() != self.drag_to_erase:
+                    if self.drag_to_cross and self.board.crosses[y, x] != self.drag_to_erase:
                         self.drag_covered.append(point)
                         self._on_rightclick_cell(y, x)
                     elif not self.drag_to_cross and grid[y][x] != self.drag_to_erase:
@@ -523,63 +660,23 @@ class NonogramGUI(QMainWindow):
                         self._on_leftclick_cell(y, x)
 
     def _highlight_hint(self, x: int, y: int) -> None:
-        # Restore default appearance of previously selected row
-        for hint in self.row_hints[self.highlighted_y]:
-            hint.set_fontweight('normal')
-        for cell in self.pixels[self.highlighted_y]:
-            cell.set_alpha(0.8)
-
-        nonogram = self.nonogram_handler.get_curr_nonogram()
-        
-        # Highlight newly selected row
-        if y >= 0 and y < nonogram.height:
-            for hint in self.row_hints[y]:
-                hint.set_fontweight('bold')
-            for cell in self.pixels[y]:
-                cell.set_alpha(0.88)
-        self.highlighted_y = y
-
-        # Restore default appearance of previously selected column
-        for hint in self.col_hints[self.highlighted_x]:
-            hint.set_fontweight('normal')
-        for row in self.pixels:
-            row[self.highlighted_x].set_alpha(0.8)
-
-        # Highlight newly selected column
-        if x >= 0 and x < nonogram.width:
-            for hint in self.col_hints[x]:
-                hint.set_fontweight('bold')
-            for row in self.pixels:
-                row[x].set_alpha(0.88)
-            # Need to overwrite one pixel
-            self.pixels[y][self.highlighted_x].set_alpha(0.88)
-        self.highlighted_x = x
-
-        self.canvas.draw_idle()
+        # Highlight the hints and filled cells of the hovered row and column (-1: none)
+        self.board.set_highlight(y, x)
+        self.highlighted_x, self.highlighted_y = x, y
 
     def _on_leftclick_cell(self, row: int, col: int) -> None:
-        # Toggle the corresponding pixel in both the current solution and the pixel grid
+        # Toggle the corresponding pixel in both the current solution and the board
         prev_val = self.solution_handler.get_curr_soln().grid[row, col]
         curr_val = not prev_val
         self.solution_handler.get_curr_soln().grid[row, col] = curr_val
-        self.pixels[row][col].set_visible(curr_val)
+        self.board.set_cell(row, col, curr_val)
 
         # Update just the two line hints instead of calling _update_hints_feeback to improve performance
-        color_hints = self.show_hint_feedback_var
-        satisfied_row_indices = self.solution_handler.solves_row_partial(row) 
-        satisfied_col_indices = self.solution_handler.solves_col_partial(col) 
-        for idx, hint in enumerate(reversed(self.row_hints[row])):
-            hint.set_color('black' if idx in satisfied_row_indices or not color_hints else 'red')
-        for idx, hint in enumerate(reversed(self.col_hints[col])):
-            hint.set_color('black' if idx in satisfied_col_indices or not color_hints else 'red')
-        
-        # Refresh canvas
-        self.canvas.draw_idle()
+        self.board.set_row_feedback(row, self._hints_ok(self.board.row_hints[row], self.solution_handler.solves_row_partial(row)))
+        self.board.set_col_feedback(col, self._hints_ok(self.board.col_hints[col], self.solution_handler.solves_col_partial(col)))
 
     def _on_rightclick_cell(self, row: int, col: int) -> None:
-        newval = not self.crosses[row][col].get_visible()
-        self.crosses[row][col].set_visible(newval)
-        self.canvas.draw_idle()
+        self.board.toggle_cross(row, col)
 
     def _on_leftclick_rowhint(self, row: int) -> None:
         nonogram = self.nonogram_handler.get_curr_nonogram()
@@ -690,139 +787,13 @@ class NonogramGUI(QMainWindow):
         self.block_hover = False
         return result[0]
 
-    def update_hint_font_sizes(self):
-        # Get the axes' bounding box in display coordinates (pixels)
-        bbox = self.axes.get_window_extent().transformed(self.figure.dpi_scale_trans.inverted())
-        width_inches, height_inches = bbox.width, bbox.height
-        dpi = self.figure.get_dpi()
-
-        # Axes size in pixels
-        ax_width_pixels = width_inches * dpi
-        ax_height_pixels = height_inches * dpi
-
-        # Data range
-        grid_width = self.nonogram_handler.get_curr_nonogram().width
-        grid_height = self.nonogram_handler.get_curr_nonogram().height
-
-        # Cell size in pixels
-        cell_width_pixels = ax_width_pixels / grid_width
-        cell_height_pixels = ax_height_pixels / grid_height
-
-        # Desired font size in pixels
-        desired_font_size_pixels = 0.75 * min(cell_width_pixels, cell_height_pixels)
-
-        # Convert to points
-        font_size = (desired_font_size_pixels * 72) / dpi
-
-        # Update all hints
-        for hint in self.row_hints:
-            for text in hint:
-                text.set_fontsize(font_size if int(text.get_text()) <= 9 else font_size//2)
-
-        for hint in self.col_hints:
-            for text in hint:
-                text.set_fontsize(font_size if int(text.get_text()) <= 9 else 2 * font_size//3)
-
-        # Update all x's
-        for row in self.crosses:
-            for cross in row:
-                cross.set_fontsize(font_size)
-
     def _draw_nonogram(self, nonogram: Nonogram):
-        self._clear_all()
         # Adjust the window size
         win_width = min(nonogram.width*SQUARE_SIZE, WINDOW_WIDTH)
         win_height = min(nonogram.height*SQUARE_SIZE, WINDOW_HEIGHT)
         self.setMinimumSize(win_width, win_height)
 
-        # Ensure the aspect ratio is equal to avoid distortion
-        self.axes.set_aspect('equal')
-
-        # Draw a black pixel in every cell then hide it
-        self.pixels = [
-            [
-                patches.Rectangle((col, nonogram.height - row - 1), 1, 1, linewidth=0, facecolor='black', alpha=0.8)
-                for col in range(nonogram.width)
-            ]
-            for row in range(nonogram.height)
-        ]
-        for row in range(nonogram.height):
-            for col in range(nonogram.width):
-                pixel = self.pixels[row][col]
-                self.axes.add_patch(pixel)
-                pixel.set_visible(False)
-
-        # Draw a 'x' in every cell then hide it
-        self.crosses = [
-            [
-                Text(col + 0.5, nonogram.height - row - 0.5, 'x', color='grey', va='center', ha='center')
-                for col in range(nonogram.width)
-            ]
-            for row in range(nonogram.height)
-        ]
-        for row in range(nonogram.height):
-            for col in range(nonogram.width):
-                cross = self.crosses[row][col]
-                self.axes.add_artist(cross)
-                cross.set_visible(False)
-
-        # Draw row hints to the left of the grid
-        for i, hints in enumerate(nonogram.row_hints):
-            if not hints:
-                hint = [self.axes.text(-0.66, nonogram.height - i - 0.6, "0", va='center', ha='center', color='red')]
-                hint[0].set_color('black')
-                self.row_hints.append(hint)
-                continue
-
-            self.row_hints.append([])
-            for j, l in enumerate(reversed(hints)):
-                hint = self.axes.text(-0.66-j*0.7, nonogram.height - i - 0.6, str(l), va='center', ha='center', color='red')
-                if not self.show_hint_feedback_var or l == 0:
-                    hint.set_color('black')
-                self.row_hints[i].append(hint)
-
-        # Draw column hints above the grid, stacked vertically
-        for j, hints in enumerate(nonogram.col_hints):
-            if not hints:
-                hint = [self.axes.text(j + 0.5, nonogram.height + 0.33, "0", va='center', ha='center', color='red')]
-                hint[0].set_color('black')
-                self.col_hints.append(hint)
-                continue
-
-            self.col_hints.append([])
-            for i, l in enumerate(reversed(hints)):
-                hint = self.axes.text(j + 0.5, nonogram.height + 0.33 + i*0.8, str(l), va='center', ha='center', color='red')
-                if not self.show_hint_feedback_var or l == 0:
-                    hint.set_color('black')
-                self.col_hints[j].append(hint)
-
-        self.update_hint_font_sizes()
-        self.figure.canvas.mpl_connect('resize_event', lambda _: self.update_hint_font_sizes())
-
-        # Setup the grid and ticks and cell index numbers
-        self.axes.set_xticks(range(0, nonogram.width+1 ),
-                             [""] + ["" for _ in range(1, nonogram.width + 1)])
-        self.axes.set_yticks(range(0, nonogram.height+1), 
-                             ["" for _ in range(1, nonogram.height + 1)] + [""]) # enumerate rows from top to bottom
-
-        # Further customize the plots appearance, like adding a grid and removing the frame
-        self.axes.yaxis.set_label_position('right')
-        self.axes.yaxis.tick_right()
-        plt.setp(self.axes.xaxis.get_majorticklabels(), ha="right",  va="top" )
-        plt.setp(self.axes.yaxis.get_majorticklabels(), va="bottom", ha="left")
-        self.axes.grid(which='both', color='black', linestyle='-', linewidth=1)
-        self.axes.spines['top'   ].set_visible(False)
-        # self.axes.spines['right' ].set_visible(False)
-        # self.axes.spines['bottom'].set_visible(False)
-        self.axes.spines['left'  ].set_visible(False)
-
-        # Redraw the canvas
-        self.canvas.draw()
-
-        # Set the xy limits so that the entire nonogram plus hints are visible
-        self.axes.set_xlim(-max([len(rh) for rh in nonogram.row_hints]), nonogram.width)
-        self.axes.set_ylim(0, nonogram.height + max([len(ch) for ch in nonogram.col_hints]))
-        self.canvas.draw_idle()
+        self.board.set_nonogram(nonogram, self.show_hint_feedback_var)
         self.highlighted_x, self.highlighted_y = -1, -1
 
         size = nonogram.width * nonogram.height
@@ -830,64 +801,24 @@ class NonogramGUI(QMainWindow):
         self.show_hint_highlight_action.setChecked(self.show_hint_highlight_var)
 
     def _draw_solution(self):
-        grid = self.solution_handler.get_curr_soln().grid
-
-        # Slower (?)
-        # for r, row in enumerate(grid):
-        #     for c, filled in enumerate(row):
-        #         self.pixels[r][c].set_visible(filled)
-
-        true_indices = np.argwhere(grid)
-        for r, c in true_indices:
-            self.pixels[r][c].set_visible(True)
-        
-        false_indices = np.argwhere(~grid)
-        for r, c in false_indices:
-            self.pixels[r][c].set_visible(False)
-
-        # Hide all 'x' marks when showing a solvers solution
-        for row in self.crosses:
-            for cross in row:
-                cross.set_visible(False)
-        
+        self._draw_grid(self.solution_handler.get_curr_soln().grid)
         self._update_hints_feedback()
 
-    def _clear_all(self) -> None:
-        # Clear all artists from the canvas
-        for p in self.pixels:
-            for pp in p:
-                pp.remove()
-        self.pixels.clear()
-
-        for ch in self.col_hints:
-            for h in ch:
-                h.remove()
-        self.col_hints.clear()
-
-        for rh in self.row_hints:
-            for h in rh:
-                h.remove()
-        self.row_hints.clear()
+    def _draw_grid(self, grid: np.ndarray):
+        # Cross marks are hidden when showing a solvers solution
+        self.board.set_grid(grid)
 
-        plt.cla()
-    
-    def _update_hints_feedback(self):
+    def _hints_ok(self, hint: List[int], satisfied_hint_indices: List[int]) -> List[bool]:
+        """Which hints of a line are shown as satisfied (all of them without hint feedback)"""
         color_hints = self.show_hint_feedback_var
+        return [not color_hints or l == 0 or idx in satisfied_hint_indices for idx, l in enumerate(hint)]
 
+    def _update_hints_feedback(self):
         # Go through every hint in every line and check it
-        for row, row_hint in enumerate(self.row_hints):
-            satisfied_hint_indices = self.solution_handler.solves_row_partial(row)
-            for idx, hint in enumerate(row_hint):
-                solves_row = not color_hints or idx in satisfied_hint_indices
-                hint.set_color('black' if solves_row else 'red')
-        for col, col_hint in enumerate(self.col_hints):
-            satisfied_hint_indices = self.solution_handler.solves_col_partial(col)
-            for idx, hint in enumerate(col_hint):
-                solves_col = not color_hints or idx in satisfied_hint_indices
-                hint.set_color('black' if solves_col else 'red')
-
-        # Refresh canvas
-        self.canvas.draw_idle()
+        for row, row_hint in enumerate(self.board.row_hints):
+            self.board.set_row_feedback(row, self._hints_ok(row_hint, self.solution_handler.solves_row_partial(row)))
+        for col, col_hint in enumerate(self.board.col_hints):
+            self.board.set_col_feedback(col, self._hints_ok(col_hint, self.solution_handler.solves_col_partial(col)))
 
     def _on_toggle_show_hint_feedback(self, *_):
         self.show_hint_feedback_var = not self.show_hint_feedback_var
@@ -908,12 +839,34 @@ class NonogramGUI(QMainWindow):
             self.check_uniqueness_var = True
             self.check_uniqueness_action.setChecked(True)
 
+    def _on_toggle_use_propagation(self, *_):
+        self.solution_handler.use_propagation = not self.solution_handler.use_propagation
+
+    def _on_toggle_use_decomposition(self, *_):
+        self.solution_handler.use_decomposition = not self.solution_handler.use_decomposition
+
+    def _on_toggle_use_cache(self, *_):
+        self.solution_handler.cache = None if self.solution_handler.cache else SolutionCache()
+
+    def _on_clear_cache(self, *_):
+        SolutionCache().clear()
+
     def on_timeout_selected(self):
         action = self.sender()
         if action.isChecked():
             self.timeout = action.data()
             self.solution_handler.set_timeout(self.timeout)
 
+    def _on_threads_selected(self):
+        action = self.sender()
+        if action.isChecked():
+            self.solution_handler.set_threads(action.data())
+
+    def _on_parallel_mode_selected(self):
+        action = self.sender()
+        if action.isChecked():
+            self.solution_handler.set_threads(self.solution_handler.threads, action.data())
+
     def update_timeout_actions(self):
         for action in self.timeout_actions.values():
             action.setChecked(action.data() == self.timeout)
\ No newline at end of file
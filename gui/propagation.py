@@ -0,0 +1,175 @@
+# Line propagation preprocessor for the ASP nonogram solvers
+# Author: Fabian Kraus
+#
+# Classic line solving: for every line, the leftmost and rightmost block placements that are
+# consistent with the cells known so far are computed. Cells covered by the same block in both
+# placements are black, cells no block can reach are white. This is repeated over all rows and
+# columns until nothing changes anymore (fixpoint). The forced cells and the narrowed block start
+# ranges are then handed to the solvers as facts.
+
+from dataclasses import dataclass
+from typing import List, Tuple
+
+import numpy as np
+
+from .common import Nonogram
+
+UNKNOWN = -1
+WHITE = 0
+BLACK = 1
+
+# Leftmost and rightmost start (0-based) of every block in a line
+StartBounds = Tuple[np.ndarray, np.ndarray]
+
+
+@dataclass
+class LinePropagation:
+    # cell states after propagation: UNKNOWN, WHITE or BLACK
+    grid: np.ndarray
+    # leftmost/rightmost block starts of every row and column
+    row_starts: List[StartBounds]
+    col_starts: List[StartBounds]
+    # False if the hints contradict each other (the nonogram has no solution)
+    consistent: bool = True
+
+
+def _blocks(hint: List[int]) -> List[int]:
+    # Zero hints and empty hints both describe an empty line
+    return [l for l in hint if l > 0]
+
+
+def _leftmost_starts(line: np.ndarray, blocks: List[int]) -> np.ndarray | None:
+    """Leftmost placement of all blocks consistent with the known cells of the line, or None if there is none"""
+    n = len(line)
+    k = len(blocks)
+    whites = np.concatenate(([0], np.cumsum(line == WHITE)))
+    blacks = np.concatenate(([0], np.cumsum(line == BLACK)))
+    idx = np.arange(n + 1)
+
+    # first_black[i]: index of the first known black cell at or after i (n if there is none)
+    black_pos = np.flatnonzero(line == BLACK)
+    first_black = np.full(n + 1, n)
+    if black_pos.size:
+        first_black[:n] = black_pos[np.minimum(np.searchsorted(black_pos, idx[:n]), black_pos.size - 1)]
+        first_black[:n][idx[:n] > black_pos[-1]] = n
+
+    # fits[j][i]: blocks j..k-1 can be placed in cells i..n-1; next_start[j][i]: first valid start of block j at or after i
+    fits = np.zeros((k + 1, n + 1), dtype=bool)
+    fits[k] = blacks[n] - blacks == 0
+    next_start = np.full((k, n + 1), n + 1)
+    for j in range(k - 1, -1, -1):
+        length = blocks[j]
+        s = idx[:max(n - length + 1, 0)]
+        end = s + length
+        place = (whites[end] - whites[s] == 0)
+        place &= np.concatenate((line[end[:-1]] != BLACK, [True])) if s.size else place
+        place &= fits[j + 1][np.minimum(end + 1, n)]
+        cand = np.full(n + 1, n + 1)
+        cand[s[place]] = s[place]
+        next_start[j] = np.minimum.accumulate(cand[::-1])[::-1]
+        fits[j] = next_start[j] <= first_black
+
+    if not fits[0][0]:
+        return None
+
+    starts = np.empty(k, dtype=np.int64)
+    pos = 0
+    for j in range(k):
+        starts[j] = next_start[j][pos]
+        pos = min(starts[j] + blocks[j] + 1, n)
+    return starts
+
+
+def line_start_bounds(line: np.ndarray, hint: List[int]) -> StartBounds | None:
+    """Leftmost and rightmost start of every block in a partially known line, or None if the line is contradictory"""
+    blocks = _blocks(hint)
+    if not blocks:
+        if np.any(line == BLACK):
+            return None
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    left = _leftmost_starts(line, blocks)
+    if left is None:
+        return None
+    right_rev = _leftmost_starts(line[::-1], blocks[::-1])
+    assert right_rev is not None
+    lengths = np.array(blocks)
+    right = len(line) - (right_rev[::-1] + lengths)
+    return left, right
+
+
+def solve_line(line: np.ndarray, hint: List[int]) -> np.ndarray | None:
+    """Fill in all cells of the line forced by the left-right overlap rule, or return None if the line is contradictory"""
+    bounds = line_start_bounds(line, hint)
+    if bounds is None:
+        return None
+    left, right = bounds
+    lengths = np.array(_blocks(hint), dtype=np.int64)
+    n = len(line)
+
+    # Difference arrays: cells reachable by some block, and cells covered by a block in both extreme placements
+    reach = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(reach, left, 1)
+    np.add.at(reach, right + lengths, -1)
+    overlap = np.zeros(n + 1, dtype=np.int64)
+    has_overlap = right < left + lengths
+    np.add.at(overlap, right[has_overlap], 1)
+    np.add.at(overlap, (left + lengths)[has_overlap], -1)
+
+    result = line.copy()
+    result[np.cumsum(reach)[:n] == 0] = WHITE
+    result[np.cumsum(overlap)[:n] > 0] = BLACK
+    return result
+
+
+def propagate(nonogram: Nonogram) -> LinePropagation:
+    """Run line solving over all rows and columns of the nonogram until a fixpoint is reached"""
+    grid = np.full((nonogram.height, nonogram.width), UNKNOWN, dtype=np.int8)
+    dirty_rows = set(range(nonogram.height))
+    dirty_cols = set(range(nonogram.width))
+
+    while dirty_rows or dirty_cols:
+        for r in sorted(dirty_rows):
+            line = solve_line(grid[r, :], nonogram.row_hints[r])
+            if line is None:
+                return LinePropagation(grid, [], [], False)
+            changed = np.flatnonzero(line != grid[r, :])
+            grid[r, :] = line
+            dirty_cols.update(changed.tolist())
+        dirty_rows.clear()
+
+        for c in sorted(dirty_cols):
+            line = solve_line(grid[:, c], nonogram.col_hints[c])
+            if line is None:
+                return LinePropagation(grid, [], [], False)
+            changed = np.flatnonzero(line != grid[:, c])
+            grid[:, c] = line
+            dirty_rows.update(changed.tolist())
+        dirty_cols.clear()
+
+    row_starts = [line_start_bounds(grid[r, :], nonogram.row_hints[r]) for r in range(nonogram.height)]
+    col_starts = [line_start_bounds(grid[:, c], nonogram.col_hints[c]) for c in range(nonogram.width)]
+    return LinePropagation(grid, row_starts, col_starts) # type: ignore
+
+
+def propagation_facts(prop: LinePropagation, nonogram: Nonogram) -> str:
+    """ASP facts for the fixed cells and narrowed block start ranges, plus constraints that make every encoding respect them"""
+    facts = ["#defined known_black/2.", "#defined known_white/2."]
+    for r, c in np.argwhere(prop.grid == BLACK):
+        facts.append(f"known_black({r+1},{c+1}).")
+    for r, c in np.argwhere(prop.grid == WHITE):
+        facts.append(f"known_white({r+1},{c+1}).")
+
+    # Block start bounds are only given for blocks with positive length, with the hint index of the original hint
+    for r, (left, right) in enumerate(prop.row_starts):
+        indices = [i for i, l in enumerate(nonogram.row_hints[r], start=1) if l > 0]
+        for i, lo, hi in zip(indices, left, right):
+            facts.append(f"start_bounds_r({r+1},{i},{lo+1},{hi+1}).")
+    for c, (left, right) in enumerate(prop.col_starts):
+        indices = [i for i, l in enumerate(nonogram.col_hints[c], start=1) if l > 0]
+        for i, lo, hi in zip(indices, left, right):
+            facts.append(f"start_bounds_c({c+1},{i},{lo+1},{hi+1}).")
+
+    facts.append(":- known_black(R,C), not fill(R,C).")
+    facts.append(":- known_white(R,C), fill(R,C).")
+    return "\n".join(facts)
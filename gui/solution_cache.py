@@ -0,0 +1,158 @@
+# Persistent cache of solver verdicts
+# Author: Fabian Kraus
+#
+# Finished solver runs are stored in an SQLite database, keyed by the canonical hash of the nonogram
+# (size and positive blocks of every line, so [0] and [] hints are the same). Every entry keeps the
+# verdict, the number of solutions found, the first MAX_CACHED_SOLUTIONS of them (bit-packed, copied
+# straight from the SolutionStore), the cells that are black/white in every solution when known, and
+# the solver and time that produced it. Entries are only replaced by more informative ones, e.g. two
+# solutions of a uniqueness check by the complete enumeration of all solutions.
+
+import sqlite3
+import time
+from dataclasses import dataclass
+from os import makedirs
+from os.path import dirname
+from typing import Tuple
+
+import numpy as np
+
+from .common import Nonogram, canonical_hash
+from .solution_store import SolutionStore
+
+DEFAULT_CACHE_PATH = ".nonogram_cache/solutions.sqlite"
+MAX_CACHED_SOLUTIONS = 1024 # solutions stored per entry; larger enumerations only keep their count and consequences
+
+VERDICT_UNSAT = "unsat"
+VERDICT_SAT = "sat" # at least one solution, uniqueness unknown
+VERDICT_UNIQUE = "unique"
+VERDICT_MULTIPLE = "multiple"
+
+_SCHEMA = """CREATE TABLE IF NOT EXISTS verdicts (
+    hash TEXT PRIMARY KEY,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    verdict TEXT NOT NULL,
+    complete INTEGER NOT NULL, -- all solutions were found
+    models INTEGER NOT NULL, -- number of solutions found
+    solutions BLOB NOT NULL, -- packed grids of the first MAX_CACHED_SOLUTIONS of them, one after the other
+    cautious BLOB, -- packed grid of the cells black in every solution
+    brave BLOB, -- packed grid of the cells black in some solution
+    solver TEXT NOT NULL,
+    solve_time REAL NOT NULL,
+    updated REAL NOT NULL
+)"""
+
+
+@dataclass
+class CachedResult:
+    verdict: str
+    complete: bool # all solutions were found
+    models: int # number of solutions found
+    solutions: np.ndarray # packed rows (see SolutionStore.packed) of the first MAX_CACHED_SOLUTIONS of them
+    cautious: np.ndarray | None # cells black in every solution
+    brave: np.ndarray | None # cells black in some solution
+    solver: str
+    solve_time: float
+
+
+class SolutionCache:
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        """Use (and create on first write) the cache database at the given path"""
+        self.path = path
+
+    def _connect(self) -> sqlite3.Connection:
+        # A connection per operation: the cache is used from solver threads and from several processes
+        if dirname(self.path):
+            makedirs(dirname(self.path), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30.0)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(_SCHEMA)
+        return connection
+
+    def lookup(self, nonogram: Nonogram) -> CachedResult | None:
+        """The cached verdict for the nonogram, if it was solved before"""
+        with self._connect() as connection:
+            row = connection.execute("SELECT verdict, complete, models, solutions, cautious, brave, solver, solve_time "
+                                     "FROM verdicts WHERE hash = ?", (canonical_hash(nonogram),)).fetchone()
+        if row is None:
+            return None
+        verdict, complete, models, solutions, cautious, brave, solver, solve_time = row
+        shape = (nonogram.height, nonogram.width)
+        row_bytes = max(1, (nonogram.width * nonogram.height + 7) // 8)
+        packed = np.frombuffer(solutions, dtype=np.uint8).reshape(-1, row_bytes)
+        return CachedResult(verdict, bool(complete), models, packed,
+                            _unpack(cautious, shape) if cautious is not None else None,
+                            _unpack(brave, shape) if brave is not None else None, solver, solve_time)
+
+    def store_solutions(self, nonogram: Nonogram, solutions: SolutionStore, check_unique: bool, all_models: bool,
+                        solver: str, solve_time: float) -> None:
+        """Record the outcome of a finished (not timed out) solver run, unless a more informative one is cached already"""
+        models = len(solutions)
+        if not models:
+            verdict = VERDICT_UNSAT
+        elif models > 1:
+            verdict = VERDICT_MULTIPLE
+        else:
+            verdict = VERDICT_UNIQUE if check_unique or all_models else VERDICT_SAT
+        complete = all_models or verdict in (VERDICT_UNSAT, VERDICT_UNIQUE)
+
+        key = canonical_hash(nonogram)
+        with self._connect() as connection:
+            old = connection.execute("SELECT verdict, complete, models, cautious, brave FROM verdicts WHERE hash = ?",
+                                     (key,)).fetchone()
+            if old is not None and _rank(*old[:3]) >= _rank(verdict, complete, models):
+                return
+
+            # The consequences are reduced over the packed rows of the store, which may be spilled to disk
+            cautious = brave = None
+            if complete and models:
+                cautious, brave = _pack(solutions.intersection()), _pack(solutions.union())
+            elif old is not None:
+                cautious, brave = old[3:]
+
+            connection.execute("INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (key, nonogram.width, nonogram.height, verdict, int(complete), models,
+                                solutions.packed(MAX_CACHED_SOLUTIONS).tobytes(),
+                                cautious, brave, solver, solve_time, time.time()))
+
+    def store_consequences(self, nonogram: Nonogram, cautious: np.ndarray, brave: np.ndarray, solver: str) -> None:
+        """Record the cells that are black in every solution and in some solution of a satisfiable nonogram"""
+        key = canonical_hash(nonogram)
+        with self._connect() as connection:
+            updated = connection.execute("UPDATE verdicts SET cautious = ?, brave = ?, updated = ? WHERE hash = ?",
+                                         (_pack(cautious), _pack(brave), time.time(), key)).rowcount
+            if not updated:
+                connection.execute("INSERT INTO verdicts VALUES (?, ?, ?, ?, 0, 0, x'', ?, ?, ?, 0.0, ?)",
+                                   (key, nonogram.width, nonogram.height, VERDICT_SAT,
+                                    _pack(cautious), _pack(brave), solver, time.time()))
+
+    def clear(self) -> None:
+        """Remove all cached verdicts"""
+        with self._connect() as connection:
+            connection.execute("DELETE FROM verdicts")
+
+
+def answers(entry: CachedResult, check_unique: bool, all_models: bool) -> bool:
+    """Does the cached entry answer a solver run with the given flags?"""
+    if all_models:
+        # Only if every solution fits into the entry
+        return entry.complete and len(entry.solutions) == entry.models
+    if entry.complete:
+        return True
+    if check_unique:
+        return entry.verdict == VERDICT_MULTIPLE and len(entry.solutions) >= 2
+    return len(entry.solutions) >= 1
+
+
+def _rank(verdict: str, complete: bool, models: int) -> Tuple[bool, bool, int]:
+    return complete, verdict != VERDICT_SAT, models
+
+
+def _pack(grid: np.ndarray | None) -> bytes | None:
+    return None if grid is None else np.packbits(grid, axis=None).tobytes()
+
+
+def _unpack(packed, shape: Tuple[int, int]) -> np.ndarray:
+    bits = np.unpackbits(np.frombuffer(packed, dtype=np.uint8), count=shape[0] * shape[1])
+    return bits.astype(bool).reshape(shape)
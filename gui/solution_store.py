@@ -0,0 +1,245 @@
+# Compact storage for the solutions found by the solvers
+# Author: Fabian Kraus
+#
+# Every solution grid is bit-packed (one bit per cell) and stored as one row of a uint8 array.
+# Duplicate grids are detected through an open-addressing hash table of (row, hash) pairs, kept at
+# most half full. Once the packed rows and the table would exceed the memory cap, both are moved to
+# anonymous temporary files and used through memory maps, so enumerating all solutions of a very
+# ambiguous nonogram does not exhaust memory.
+
+import os
+import shutil
+import tempfile
+from typing import Iterator, Tuple
+
+import numpy as np
+
+from .common import Nonogram, NonogramSoln
+
+DEFAULT_MEMORY_CAP = 64 * 1024 * 1024 # bytes of packed solutions and their index kept in memory before spilling to disk
+CHUNK_ROWS = 4096 # rows read at once when reducing over all solutions
+MIN_TABLE_SLOTS = 16
+COPY_BYTES = 1024 * 1024 # buffer size when copying a spill file
+
+_EMPTY = 0xFFFFFFFF # row of an unused table slot (so a store holds less than 2^32 - 1 solutions)
+
+
+class SolutionStore:
+    def __init__(self, nonogram: Nonogram, memory_cap: int = DEFAULT_MEMORY_CAP, spill_dir: str | None = None):
+        """Init an empty store for solutions of the given nonogram, spilling to a file in spill_dir (default: system temp dir)"""
+        self.nonogram = nonogram
+        self.memory_cap = memory_cap
+        self.spill_dir = spill_dir
+        self.handoff_dir: str | None = None # where pickling leaves the copy of the spill file (default: spill_dir)
+        self.row_bytes = max(1, (nonogram.width * nonogram.height + 7) // 8)
+
+        self._rows = np.empty((0, self.row_bytes), dtype=np.uint8) # in-memory rows (with spare capacity)
+        self._count = 0
+        self._table = _empty_table(0) # slots of (row, hash of the packed bytes), memory-mapped once spilled
+        self._file = None # spill file, once the memory cap was reached
+        self._table_file = None # backing file of the table, once spilled
+        self._mmap: np.memmap | None = None # read view of the spill file, remapped after it grew
+        self._cached: Tuple[int, NonogramSoln] | None = None # last unpacked solution
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, idx: int) -> NonogramSoln:
+        """Unpack the solution at the given index (negative indices count from the end)"""
+        if idx < 0:
+            idx += self._count
+        if not 0 <= idx < self._count:
+            raise IndexError("solution index out of range")
+        if self._cached and self._cached[0] == idx:
+            return self._cached[1]
+
+        soln = NonogramSoln(self.nonogram)
+        cells = self.nonogram.width * self.nonogram.height
+        soln.grid[:, :] = np.unpackbits(self._packed_rows()[idx], count=cells).reshape(soln.grid.shape)
+        self._cached = (idx, soln)
+        return soln
+
+    def __iter__(self) -> Iterator[NonogramSoln]:
+        for idx in range(self._count):
+            yield self[idx]
+
+    def append(self, soln: NonogramSoln) -> bool:
+        """Store the solution unless an identical one is stored already; return whether it was added"""
+        return self._add_packed(np.packbits(soln.grid, axis=None))
+
+    def append_packed(self, packed: np.ndarray) -> bool:
+        """Store a solution given as packed row (see packed) unless an identical one is stored already"""
+        return self._add_packed(np.asarray(packed, dtype=np.uint8))
+
+    def packed(self, count: int | None = None) -> np.ndarray:
+        """The first count (default: all) solutions as packed rows, without unpacking them (a view, possibly of the spill file)"""
+        return self._packed_rows()[:count]
+
+    def clear(self) -> None:
+        """Remove all solutions and delete the spill file"""
+        self._rows = np.empty((0, self.row_bytes), dtype=np.uint8)
+        self._count = 0
+        self._table = _empty_table(0)
+        self._mmap = None
+        self._cached = None
+        for spill in (self._file, self._table_file):
+            if spill:
+                spill.close()
+        self._file = self._table_file = None
+
+    @property
+    def spilled(self) -> bool:
+        """Are the solutions stored on disk?"""
+        return self._file is not None
+
+    def intersection(self) -> np.ndarray:
+        """Boolean grid of the cells that are black in every stored solution (all True if the store is empty)"""
+        return self._reduce(np.bitwise_and, 0xFF)
+
+    def union(self) -> np.ndarray:
+        """Boolean grid of the cells that are black in some stored solution (all False if the store is empty)"""
+        return self._reduce(np.bitwise_or, 0x00)
+
+    def _reduce(self, op: np.ufunc, initial: int) -> np.ndarray:
+        # Reduce the packed rows chunk by chunk, so a spilled store is never read into memory at once
+        acc = np.full(self.row_bytes, initial, dtype=np.uint8)
+        rows = self._packed_rows()
+        for start in range(0, self._count, CHUNK_ROWS):
+            acc = op(acc, op.reduce(rows[start:start + CHUNK_ROWS], axis=0))
+        cells = self.nonogram.width * self.nonogram.height
+        return np.unpackbits(acc, count=cells).astype(bool).reshape(self.nonogram.height, self.nonogram.width)
+
+    def _add_packed(self, packed: np.ndarray) -> bool:
+        key = _hash(packed)
+        if 2 * (self._count + 1) > len(self._table):
+            self._resize_table(max(MIN_TABLE_SLOTS, 2 * len(self._table)))
+        slot = self._find(packed, key)
+        if self._table[slot, 0] != _EMPTY:
+            return False
+
+        if self._file is None and (self._count + 1) * self.row_bytes + self._table.nbytes > self.memory_cap:
+            self._spill()
+        if self._file is not None:
+            self._file.seek(0, 2)
+            self._file.write(packed.tobytes())
+        else:
+            if self._count == len(self._rows):
+                # Grow geometrically, but never beyond the memory cap
+                capacity = max(16, 2 * len(self._rows))
+                capacity = max(self._count + 1, min(capacity, self.memory_cap // self.row_bytes))
+                grown = np.empty((capacity, self.row_bytes), dtype=np.uint8)
+                grown[:self._count] = self._rows[:self._count]
+                self._rows = grown
+            self._rows[self._count] = packed
+
+        self._table[slot] = (self._count, key)
+        self._count += 1
+        return True
+
+    def _find(self, packed: np.ndarray, key: int) -> int:
+        """Slot of the stored row equal to packed, or the free slot where it belongs"""
+        mask = len(self._table) - 1
+        slot = key & mask
+        while True:
+            row, stored_key = self._table[slot]
+            if row == _EMPTY or (stored_key == key and np.array_equal(self._packed_rows()[row], packed)):
+                return slot
+            slot = (slot + 1) & mask
+
+    def _insert(self, row: int, key: int) -> None:
+        """Put a row known to be distinct into the table"""
+        mask = len(self._table) - 1
+        slot = key & mask
+        while self._table[slot, 0] != _EMPTY:
+            slot = (slot + 1) & mask
+        self._table[slot] = (row, key)
+
+    def _new_table(self, slots: int) -> np.ndarray:
+        """Empty table with the given number of slots, in a temporary file if the rows were spilled"""
+        if self._file is None:
+            return _empty_table(slots)
+        self._table_file = tempfile.TemporaryFile(dir=self.spill_dir)
+        self._table_file.truncate(slots * 2 * 4)
+        table = np.memmap(self._table_file, dtype=np.uint32, mode='r+', shape=(slots, 2))
+        table[:, 0] = _EMPTY
+        return table
+
+    def _resize_table(self, slots: int) -> None:
+        old, old_file = self._table, self._table_file
+        self._table = self._new_table(slots)
+        for start in range(0, len(old), CHUNK_ROWS):
+            chunk = np.array(old[start:start + CHUNK_ROWS])
+            for row, key in chunk[chunk[:, 0] != _EMPTY]:
+                self._insert(int(row), int(key))
+        del old
+        if old_file:
+            old_file.close()
+
+    def _spill(self) -> None:
+        """Move the in-memory rows and table to anonymous temporary files (deleted when closed)"""
+        self._file = tempfile.TemporaryFile(dir=self.spill_dir)
+        self._file.write(self._rows[:self._count].tobytes())
+        self._rows = np.empty((0, self.row_bytes), dtype=np.uint8)
+        table = self._table
+        self._table = self._new_table(len(table))
+        self._table[:] = table
+
+    def _packed_rows(self) -> np.ndarray:
+        """All stored packed rows, as an in-memory view or a memory map of the spill file"""
+        if self._file is None:
+            return self._rows[:self._count]
+        if self._count == 0:
+            return np.empty((0, self.row_bytes), dtype=np.uint8)
+        if self._mmap is None or len(self._mmap) != self._count:
+            self._file.flush()
+            self._mmap = np.memmap(self._file, dtype=np.uint8, mode='r', shape=(self._count, self.row_bytes))
+        return self._mmap
+
+    # Stores are sent between processes (portfolio, batch solving). In-memory rows are pickled as they are;
+    # a spilled store is copied file to file into a named temporary file in handoff_dir instead, which the
+    # receiving side takes over (and unlinks) as its spill file. Either way the receiver rebuilds its own table.
+    # Worker processes set handoff_dir to a directory the receiving process removes after the run, so copies
+    # that are never unpickled (results left queued, a worker killed while sending) are removed with it.
+    def __getstate__(self) -> dict:
+        state = {"nonogram": self.nonogram, "memory_cap": self.memory_cap, "spill_dir": self.spill_dir}
+        if self._file is None:
+            state["packed"] = self._rows[:self._count]
+            return state
+        self._file.flush()
+        self._file.seek(0)
+        with tempfile.NamedTemporaryFile(dir=self.handoff_dir or self.spill_dir, delete=False) as copy:
+            shutil.copyfileobj(self._file, copy, COPY_BYTES)
+        state["spill_path"], state["count"] = copy.name, self._count
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["nonogram"], state["memory_cap"], state["spill_dir"])
+        if "packed" in state:
+            for packed in state["packed"]:
+                self._add_packed(packed)
+            return
+
+        self._file = open(state["spill_path"], "r+b")
+        try:
+            os.unlink(state["spill_path"]) # the open file lives on until closed
+        except OSError:
+            pass
+        self._count = state["count"]
+        slots = MIN_TABLE_SLOTS
+        while slots < 2 * self._count:
+            slots *= 2
+        self._table = self._new_table(slots)
+        rows = self._packed_rows()
+        for start in range(0, self._count, CHUNK_ROWS):
+            for row, packed in enumerate(rows[start:start + CHUNK_ROWS], start):
+                self._insert(row, _hash(packed))
+
+
+def _hash(packed: np.ndarray) -> int:
+    return hash(packed.tobytes()) & 0xFFFFFFFF
+
+
+def _empty_table(slots: int) -> np.ndarray:
+    table = np.zeros((slots, 2), dtype=np.uint32)
+    table[:, 0] = _EMPTY
+    return table